@@ -582,7 +582,7 @@ class Exposure(ExposureClass.ExposureClass):
         if  not GetObject('controller').DemoMode:
             loop=0
             while not self.image.isValid and loop<100:
-                loop=+1
+                loop+=1
                 time.sleep(.050)
                 if loop>=100:
                     Print('ERROR image data not received in time')
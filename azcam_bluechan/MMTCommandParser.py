@@ -1,152 +1,206 @@
-# MMTCommandParser for ccdacq
-# 21Jul14 last change MPL
+"""
+Contains MMTCommandParser, the parser for MMT ICE syntax ccdacq commands.
 
+Usage: python -m azcam_bluechan.MMTCommandParser -benchmark 100000
+"""
+
+import json
+import re
 import shlex
-from AzCamServerCommands import *
+import sys
+import time
+
+import azcam
+import azcam.utils
+
+# a quoted string or a run of non-blank characters, quotes are removed and
+# backslashes kept so Windows paths are not mangled as by shlex
+TOKEN = re.compile(r'"([^"]*)"|\'([^\']*)\'|(\S+)')
+
+# ICE commands, each executed by the ccdacq tool method of the same name
+COMMANDS = (
+    "get",
+    "set",
+    "batch",
+    "setformat",
+    "setconfiguration",
+    "setroi",
+    "setgainspeed",
+    "setexposure",
+    "setparameter",
+    "startexposure",
+    "startexposure_wait",
+    "expose",
+    "expose1",
+    "readexposure",
+    "pauseexposure",
+    "resumeexposure",
+    "abortexposure",
+    "readimage",
+    "sendimage",
+    "adddestination",
+    "removedestination",
+    "subscribe",
+    "unsubscribe",
+    "writetiming",
+    "cleararray",
+    "parshift",
+    "closeconnection",
+    "reset",
+)
+
+# get and set attributes are matched in lower case
+LOWERCASE_ATTRIBUTE = ("get", "set")
+
+
+def tokenize(command):
+    """
+    Split a command string into tokens.
+    Commands without quotes take the str.split() fast path.
+    """
+
+    if '"' not in command and "'" not in command:
+        return command.split()
+
+    return [a or b or c for a, b, c in TOKEN.findall(command)]
+
+
+def normalize(tokens):
+    """
+    Return (command name, args) of command tokens, with the command name
+    and a get or set attribute in lower case.
+    """
+
+    name = tokens[0].lower()
+    args = tokens[1:]
+    if name in LOWERCASE_ATTRIBUTE and args:
+        args[0] = args[0].lower()
+
+    return name, args
+
+
+def format_reply(reply):
+    """
+    Format a command reply as the command server does, always starting
+    with OK, ERROR or WARNING.
+    """
+
+    if reply is None or reply == "":
+        return "OK"
+    if isinstance(reply, dict):
+        reply = json.dumps(reply)
+    elif isinstance(reply, list):
+        reply = " ".join(str(x) for x in reply)
+    reply = str(reply)
+    if not reply.startswith(("OK", "ERROR", "WARNING")):
+        reply = f"OK {reply}"
+
+    return reply
+
 
-def MMTCommandParser(Command):
+class MMTCommandParser(object):
     """
-    Alternate command parser for MMT ICE syntax.
-    Command replies are not in a list, but a single string, as per AzCam 2.x.
+    Parser for MMT ICE syntax commands such as "SetROI 1 2688 1 512 1 1".
+    Command names are case insensitive and bound once to the ccdacq tool
+    methods which execute them.
     """
-    
+
+    def __init__(self, tool=None):
+        tool = azcam.db.tools["ccdacq"] if tool is None else tool
+
+        # {command: bound method}
+        self.commands = {name: getattr(tool, name) for name in COMMANDS}
+
+    def parse(self, command):
+        """
+        Return (method, args) for a command string, or None if it is not an
+        ICE command, such as a python method call, so it can be processed
+        normally.
+        """
+
+        if command.endswith(")"):
+            return None
+
+        tokens = tokenize(command)
+        if len(tokens) == 0:
+            return None
+
+        name, args = normalize(tokens)
+        method = self.commands.get(name)
+        if method is None:
+            return None
+
+        return method, args
+
+    def command(self, command):
+        """
+        Execute an ICE command and return its reply string,
+        or None if it is not an ICE command.
+        Exceptions are raised to the caller.
+        """
+
+        parsed = self.parse(command)
+        if parsed is None:
+            return None
+
+        method, args = parsed
+
+        return format_reply(method(*args))
+
+
+def benchmark(number_commands=100000):
     """
-    Below are the ccdacq commands to be supported:
-    
-    * Get camtemp
-    * Get dewtemp
-    * Get utc-obs
-    * ReadExposure
-    * PauseExposure
-    * ResumeExposure
-    * AbortExposure
-    * ClearArray
-    * CloseConnection
-    * Reset
-    * Set ReadOutMode wait
-    * Set ShutterState
-    * StartExposure 0
-    * ReadImage 0
-    * Get pixelcount
-    * ParShift
-    * SetFormat
-    * SetConfiguration
-    * SetROI
-    * SetGainSpeed
-    * SetExposure
-    * SendImage 3
+    Parse a mix of ICE commands number_commands times with shlex.split
+    (the old parser), azcam.utils.parse (the command server) and
+    MMTCommandParser.parse and return commands per second of each.
     """
 
-    # load all defined objects
-    for name in Globals.Objects.keys(): 
-	globals()[name] = Globals.Objects[name]
-
-    # if command is a python method, return None to process normally later
-    if Command.endswith(')'):
-        return None
-
-    # tokenize
-    #tokens=shlex.shlex(Command)
-    tokens=shlex.split(Command)   # this is messing with slashes
-    token=[]
-    for t in tokens:
-        token.append(str(t))
-    cmd=token[0].lower()
-    
-    if cmd=='reset':
-        reply=controller.Reset()
-	
-    elif cmd=='abortexposure':
-        reply=controller.ExposureAbort()
-    elif cmd=='pauseexposure':
-        reply=controller.ExposurePause()
-    elif cmd=='resumeexposure':
-        reply=controller.ExposureResume()
-    elif cmd=='get' and token[1].lower()=='pixelcount':
-	count=controller.GetPixelsRemaining()[1] # counts down
-        reply=[Globals.OK,str(focalplane.NumPixImage-count)]
-    elif cmd=='get' and token[1].lower()=='camtemp':
-        rep=tempcon.GetTemperatures()
-	camtemp = str(int(float(rep[1])*1000.)/1000.)
-	reply=[rep[0],camtemp]        
-    elif cmd=='get' and token[1].lower()=='dewtemp':
-        rep=tempcon.GetTemperatures()
-	dewtemp = str(int(float(rep[2])*1000.)/1000.)
-	reply=[rep[0],dewtemp]        
-    elif cmd=='get' and token[1].lower()=='utc-obs':
-	reply=controller.header.GetKeyword('UTC-OBS')
-	reply=[Globals.OK,reply[1]]
-    elif cmd=='parshift':
-	rows=int(token[1])
-        reply=controller.Parshift(rows)
-    elif cmd=='setroi':
-        reply=focalplane.SetRoi(int(token[1]),int(token[2]),int(token[3]),int(token[4]),
-	    int(token[5]),int(token[6]))
-    elif cmd=='setformat':
-        reply=focalplane.SetFormat(int(token[1]),int(token[2]),int(token[3]),int(token[4]),
-	    int(token[5]),int(token[6]),int(token[7]),int(token[8]),int(token[9]))
-    elif cmd=='setconfiguration':  # Flag Splits NumDetX NumDetY AmpConfig
-	Flag=int(token[1])     # ignored
-	Splits=int(token[2])   # ignored
-	NumDetX=int(token[3])  # ignored
-	NumDetY=int(token[4])  # ignored
-	AmpConfig=token[5]     # string
-        reply=focalplane.SetFocalPlane(1,1,1,1,AmpConfig)
-    elif cmd=='setgainspeed':  # gain speed
-	vg=int(token[1])
-	vs=int(token[2])       # speed ignored for gen1
-        reply=controller.SetVideoGain(vg)
-        reply=controller.SetVideoSpeed(vs)
-    elif cmd=='set' and token[1].lower()=='readoutmode':   # ignored as always 'wait' for MMT
-	reply=[Globals.OK]
-	
-    # exposure time
-    elif cmd=='setexposure':
-	et=int(token[1])/1000.  # millisecs to seconds
-        reply=exposure.SetExposureTime(et)
-    elif cmd=='readexposure':
-        reply=controller.UpdateExposureTimeRemaining()
-        etr=float(reply[1])
-	et=exposure.ExposureTime-etr
-	reply=[reply[0],str(int(et*1000))]        
-	
-    # set shutter to open or close
-    elif cmd=='set' and token[1].lower()=='shutterstate':   # set shutterstate open/close
-	state=token[2]
-	if state=='open':
-	    imagetype='object'        # open shutter
-	else:
-	    imagetype='dark'
-        exposure.ImageType=imagetype  # close shutter
-	reply=[Globals.OK]
-	
-    # flush/clear device
-    elif cmd=='cleararray':
-	exposure.ExposureFlag=exposure.EF_SETUP
-        reply=exposure.Flush()
-    # start integration
-    elif cmd=='startexposure': # StartExposure 0 (flag ignored)
-	exposure.ExposureFlag=exposure.EF_EXPOSING
-	reply=exposure.BeginCcdacq()
-	reply=exposure.IntegrateCcdacq()
-    # start readout
-    elif cmd=='readimage':     # ReadImage Flag
-	exposure.ExposureFlag=exposure.EF_READOUT
-	reply=exposure.ReadoutCcdacq()
-    # send image to ccdacq
-    elif cmd=='sendimage':     # SendImage 3 Host Port
-	exposure.ExposureFlag=exposure.EF_NONE
-	Flag=int(token[1])     # ignored
-	Host=token[2]
-	Port=int(token[3])
-	reply=exposure.SendImageFileToCCDacq(Host,Port)
-	
-    elif cmd=='closeconnection':  # read by CommandServer
-        reply=[Globals.OK]
-    else:
-        return None
-    
-    # make reply string
-    s=' '.join(reply)
-    
-    return s
+    from azcam_bluechan.ccdacq import CCDACQ
+
+    commands = [
+        "Get camtemp",
+        "Get pixelcount",
+        "ReadExposure",
+        "SetExposure 1000",
+        "SetROI 1 2688 1 512 1 1",
+        "Set ShutterState open",
+        "StartExposure 0",
+        "SendImage 3 ccdacq.mmto.arizona.edu 6543",
+        "WriteTiming 'c:\\data\\timing.csv'",
+    ]
+    rounds = max(1, number_commands // len(commands))
+    number = rounds * len(commands)
+
+    def rate(parse):
+        t0 = time.perf_counter()
+        for _ in range(rounds):
+            for command in commands:
+                parse(command)
+        return number / (time.perf_counter() - t0)
+
+    parser = MMTCommandParser(CCDACQ())
+
+    return {
+        "shlex": rate(lambda c: shlex.split(c)[0].lower()),
+        "azcam": rate(lambda c: azcam.utils.parse(c, 0)[0].lower()),
+        "mmt": rate(parser.parse),
+    }
+
+
+def main():
+    args = sys.argv
+
+    number_commands = (
+        int(args[args.index("-benchmark") + 1]) if "-benchmark" in args else 100000
+    )
+
+    rates = benchmark(number_commands)
+    print(f"shlex.split       {rates['shlex']:10.0f} commands/sec")
+    print(f"azcam.utils.parse {rates['azcam']:10.0f} commands/sec")
+    print(f"MMTCommandParser  {rates['mmt']:10.0f} commands/sec")
+
+    return
+
+
+if __name__ == "__main__":
+    main()
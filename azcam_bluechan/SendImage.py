@@ -1,409 +1,264 @@
-# Contains SendImage class to send local image to remote server.
-# 17May13 last change MPL
+"""
+Contains the SendImage class to send a local image to a remote image server.
 
-import os,pyfits,numpy,threading,shutil,time,subprocess,socket
-from AzCamServerCommands import *
+Supported image server types are azcam, dataserver, lbtguider, mmtguider and ccdacq.
+Image files are streamed with socket.sendfile() so the file is never held
+in memory, and each send finishes on the server's acknowledgement or close
+rather than a fixed delay.
+"""
 
-class SendImage(object):
+import os
+import socket
+import time
+
+import azcam
+import azcam.exceptions
+from azcam.tools.exposure_sendimage import SendImage as SendImageBase
+
+from azcam_bluechan.sendimage_ccdacq import sendimage_ccdacq
+
+
+class SendImage(SendImageBase):
     """
-    SendImage class to send local image to a remote ImageServer.
+    SendImage class to send local image to a remote image server.
     """
 
     def __init__(self):
-        """
-        Initialize sendimage object.
-        """
-        
-        self.RemoteImageServerHost=''
-        self.RemoteImageServerPort=0
-        self.RemoteImageFileName=''
-        
-        # lbtguider,dataserver,ccdacq,azcam,mmtguider
-        self.ServerType='azcam'
-                
-    def SetRemoteImage(self,RemoteServerHost='',RemoteServerPort=0):
+        super().__init__()
+
+        # seconds to wait for the azcam image server status after a send
+        self.ack_timeout = 10.0
+        # maximum seconds to wait for the dataserver to close after a send
+        self.close_timeout = 3.0
+
+        self.senders = {
+            "azcam": self.azcam_imageserver,
+            "dataserver": self.dataserver,
+            "lbtguider": self.lbtguider_imageserver,
+            "mmtguider": self.mmtguider_imageserver,
+            "ccdacq": self.ccdacq_imageserver,
+        }
+
+    def set_remote_imageserver(
+        self,
+        remote_imageserver_host="",
+        remote_imageserver_port=6543,
+        remote_imageserver_type="dataserver",
+        remote_imageserver_filename="image",
+    ):
         """
         Set parameters so image files are sent to a remote image server.
-        If no host is provided then reset to local image file.
-        """
-    
-        if RemoteServerHost=='':
-            self.RemoteImageServer=0
-        else:
-            self.RemoteImageServer=1
-            
-        self.RemoteImageServerHost=int(RemoteServerHost)
-        self.RemoteImageServerPort=int(RemoteServerPort)
-        
-        return [Globals.OK]
-    
-    def SendImage(self,Filename,ServerType=''):
         """
-        Send image to a remote ImageServer using remote Filename.
-        """
-        
-        if ServerType=='':
-            ServerType=self.ServerType
-            
-        if ServerType=='azcam':
-            reply=self.SendImageFileToAzCamImageServer(Filename,self.RemoteImageServerHost,self.RemoteImageServerPort)
-        elif ServerType=='lbtguider':
-            reply=self.SendImageFileToLBTGuider(Filename,self.RemoteImageServerHost,self.RemoteImageServerPort)
-        elif ServerType=='mmtguider':
-            reply=self.SendImageFileToMMTGuider(Filename,self.RemoteImageServerHost,self.RemoteImageServerPort)
-        elif ServerType=='ccdacq':
-            reply=self.SendImageFileToCCDacq(self.RemoteImageServerHost,self.RemoteImageServerPort)
-        elif ServerType=='dataserver':
-            reply=self.SendImageFileToDataServer(Filename,self.RemoteImageServerHost,self.RemoteImageServerPort)
-        else:
-            reply=[Globals.ERROR,'unknown remote image server type']
-
-        return reply
-    
-    def SendImageFileToAzCamImageServer(self,Filename,RemoteImageServerHost,RemoteImageServerPort):
-        """
-        Send image to AzCam image server.    
-        """
-
-        # open image file on disk
-        dfile = open(Filename,'rb')	
-        if not dfile:
-            return [Globals.ERROR,'could not open image file']
 
-        # get file size
-        lSize=os.path.getsize(Filename)
+        if remote_imageserver_type not in self.senders:
+            raise azcam.exceptions.AzcamError(
+                f"Unknown remote image server type {remote_imageserver_type}"
+            )
 
-        # read the file into the buffer
-        buff=dfile.read()
+        super().set_remote_imageserver(
+            remote_imageserver_host,
+            remote_imageserver_port,
+            remote_imageserver_type,
+            remote_imageserver_filename,
+        )
+        self.imageserver_send = self.senders[remote_imageserver_type]
 
-        # close the file
-        dfile.close()
+        return
 
-        # open socket to DataServer
-        DataServerSocket=socket.socket(socket.AF_INET,socket.SOCK_STREAM)
-        DataServerSocket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR,0)
-        DataServerSocket.settimeout(10.)
-        try:
-            DataServerSocket.connect((RemoteImageServerHost,int(RemoteImageServerPort)))
-        except Exception,message:
-            DataServerSocket.close()
-            return [Globals.ERROR,'remote ImageServer socket not opened: %s' % message]	
-
-        if self.RemoteImageFileName!='':
-            remotefile=self.RemoteImageFileName
-        else:
-            remotefile=self.image.filename.GetName()[1]
-            if self.image.filename.Overwrite or self.image.filename.TestImage:
-                remotefile='!'+remotefile
-        Print('Sending image to %s as %s' % (RemoteImageServerHost,remotefile))
-
-        # send header
-        # file types: 0 FITS, 1 MEF, 2 binary
-        s1='%16d %s %d %d %d %d' % (lSize,remotefile,self.image.FileType,
-                                    self.image.SizeX,self.image.SizeY,self.DisplayImage)
-        s1='%-256s' % s1
-        status=DataServerSocket.send(s1)
-        if status != 256:
-            return[Globals.ERROR,'could not send image header to remote ImageServer']
-
-        # get 16 char ASCII header return status from image server
-        #reply = DataServerSocket.recv(16)
-        #if len(reply) != 16:
-        #    return [Globals.ERROR,'did not receive header return status from remote ImageServer']
-        #retstat=int(reply[:1])
-        #retstat=int(reply)
-        retstat=0
-
-        # check header return status codes
-        if retstat != 0:
-            if retstat==-1:
-                return [Globals.ERROR,'bad reply from remote ImageServer']
-            elif retstat==-2:
-                return [Globals.ERROR,'remote ImageServer not create image filename']
-            elif retstat==-3:  # 
-                return [Globals.ERROR,'folder does not exist on remote machine']
-            else:
-                return [Globals.ERROR,'unknown error from remote ImageServer']
-
-        # send file data
-        try:
-            reply=DataServerSocket.send(buff)
-        except:
-            return [Globals.ERROR,'did not send image file data to remote ImageServer']
+    def send_image(self, localfile=None, remotefile=None):
+        """
+        Send image to remote image server and publish the frame sent event.
+        """
 
-        if reply!=len(buff):
-            return [Globals.ERROR,'did not send entire image file data to remote ImageServer']
+        exposure = azcam.db.tools["exposure"]
+        timeline = getattr(exposure, "timeline", None)
 
-        # get 16 char ASCII final return status from image server
-        try:
-            reply = DataServerSocket.recv(16)
-        except:
-            return [Globals.ERROR,'did not receive return status from remote ImageServer']
+        t0 = time.monotonic()
+        super().send_image(localfile, remotefile)
+        if timeline is not None:
+            timeline.mark("send", t0, time.monotonic())
 
-        if len(reply)!=2:
-            return [Globals.ERROR,'did not receive entire return status from remote ImageServer']
+        events = getattr(exposure, "frame_events", None)
+        if events is not None:
+            events.publish("sent", destination=self.remote_imageserver_host)
 
-        retstat=int(reply[:1])
+        return
 
-        # check final return status error codes
-        if retstat != 0:
-            return [Globals.ERROR,'bad final return status from remote ImageServer']
+    def ccdacq_imageserver(self, localfile, remotefile=None, data=None):
+        """
+        Send raw image data to ccdacq.
+        data is the pixel buffer to send, default is the current exposure image.
+        """
 
-        # close socket
-        #time.sleep()
-        DataServerSocket.close()
+        return sendimage_ccdacq(self, localfile, remotefile, data)
 
-        Print('Finished sending image')
+    # *************************************************************************
+    # transport
+    # *************************************************************************
 
-        return [Globals.OK]
+    def _connect(self, name):
+        """
+        Open a socket to the remote image server.
+        """
 
-    def SendImageFileToDataServer(self,Filename,RemoteImageServerHost,RemoteImageServerPort):
+        try:
+            sock = socket.create_connection(
+                (self.remote_imageserver_host, int(self.remote_imageserver_port)),
+                timeout=self.timeout,
+            )
+        except OSError as e:
+            raise azcam.exceptions.AzcamError(
+                f"{name} {self.remote_imageserver_host}:{self.remote_imageserver_port} not opened: {e}"
+            )
+
+        return sock
+
+    def _send_file(self, sock, localfile, name):
         """
-        Send image to Jeff Fookson's data server.    
+        Stream a file on a socket with sendfile().
         """
 
-        # open image file on disk
-        dfile = open(Filename,'rb')	
-        if not dfile:
-            return [Globals.ERROR,'could not open local image file']
+        try:
+            with open(localfile, "rb") as dfile:
+                numsent = sock.sendfile(dfile)
+        except OSError as e:
+            raise azcam.exceptions.AzcamError(
+                f"Could not send image file data to {name}: {e}"
+            )
 
-        # get file size
-        lSize=os.path.getsize(Filename)
+        if numsent != os.path.getsize(localfile):
+            raise azcam.exceptions.AzcamError(
+                f"Did not send entire image file data to {name}"
+            )
 
-        # read the file into the buffer
-        buff=dfile.read()
+        return numsent
 
-        # close the file
-        dfile.close()
+    def _wait_close(self, sock):
+        """
+        Half-close the socket and wait at most close_timeout seconds for the
+        server to close its end, which it does after reading all data.
+        Raises AzcamError if the server does not close in time.
+        """
 
-        # open socket to DataServer
-        DataServerSocket=socket.socket(socket.AF_INET,socket.SOCK_STREAM)
-        DataServerSocket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR,0)
-        DataServerSocket.settimeout(10.)
+        end = time.monotonic() + self.close_timeout
         try:
-            DataServerSocket.connect((RemoteImageServerHost,RemoteImageServerPort))
-        except Exception,message:
-            DataServerSocket.close()
-            return [Globals.ERROR,'remote DataServer socket not opened: %s' % message]	
-
-        if self.RemoteImageFileName!='':
-            remotefile=self.RemoteImageFileName
-        else:
-            remotefile=self.image.filename.GetName()[1]
-            if self.image.filename.Overwrite or self.image.filename.TestImage:
-                remotefile='!'+remotefile
-        Print('Sending image to %s as %s' % (RemoteImageServerHost,remotefile))
-
-        # send header
-        # file types: 0 FITS, 1 MEF, 2 binary
-        s1='%16d %s %d %d %d %d' % (lSize,remotefile,self.image.FileType,
-                                    self.image.SizeX,self.image.SizeY,self.DisplayImage)
-        s1='%-256s' % s1
-        status=DataServerSocket.send(s1)
-        if status != 256:
-            return[Globals.ERROR,'could not send image header to remote DataServer']
-
-        # get 16 char ASCII header return status from image server
-        #reply = DataServerSocket.recv(16)
-        #if len(reply) != 16:
-        #    return [Globals.ERROR,'did not receive header return status from remote DataServer']
-        #retstat=int(reply[:1])
-        #retstat=int(reply)
-        retstat=0
-
-        # check header return status codes (updated 14jul11)
-        if retstat != 0:
-            if retstat==1:    # overwrite existing name wihtout flag
-                return [Globals.ERROR,'remote DataServer could not create image filename']
-            elif retstat==2:  # not enough space
-                return [Globals.ERROR,'remote DataServer does not have enough disk space']
-            elif retstat==3:  # 
-                return [Globals.ERROR,'remote DataServer reports folder does not exist']
-            else:
-                return [Globals.ERROR,'unknown error from remote DataServer']
-
-        # send file data
-        try:
-            reply=DataServerSocket.send(buff)
-        except:
-            return [Globals.ERROR,'did not send image file data to remote DataServer']
-
-        if reply!=len(buff):
-            return [Globals.ERROR,'did not send entire image file data to remote DataServer']
-
-        # get 16 char ASCII final return status from image server
+            sock.shutdown(socket.SHUT_WR)
+            while True:
+                remaining = end - time.monotonic()
+                if remaining <= 0:
+                    raise socket.timeout()
+                sock.settimeout(remaining)
+                if not sock.recv(1024):
+                    break
+        except socket.timeout:
+            raise azcam.exceptions.AzcamError(
+                f"remote dataserver did not close within {self.close_timeout} seconds"
+            )
+        except OSError as e:
+            raise azcam.exceptions.AzcamError(f"remote dataserver close failed: {e}")
+
+        return
+
+    def _remote_filename(self, remotefile):
+        if remotefile is None:
+            remotefile = self.remote_imageserver_filename
+        if self.overwrite or self.test_image:
+            remotefile = "!" + remotefile
+
+        return remotefile
+
+    def _dataserver_header(self, localfile, remotefile):
         """
-        try:
-            reply = DataServerSocket.recv(16)
-        except:
-            return [Globals.ERROR,'did not receive return status from remote ImageServer']
-
-        if len(reply)!=2:
-            return [Globals.ERROR,'did not receive entire return status from remote ImageServer']
-
-        retstat=int(reply[:1])
-
-        # check final return status error codes
-        if retstat != 0:
-            return [Globals.ERROR,'bad final return status from remote ImageServer']
+        Return the 256 byte header used by the azcam image server and dataserver.
+        File types: 0 FITS, 1 MEF, 2 binary.
         """
 
-        # close socket
-        time.sleep(3)
-        DataServerSocket.close()
+        s1 = "%16d %s %d %d %d %d" % (
+            os.path.getsize(localfile),
+            remotefile,
+            self.filetype,
+            self.size_x,
+            self.size_y,
+            self.display_image,
+        )
 
-        Print('Finished sending image')
+        return str.encode("%-256s" % s1)
 
-        return [Globals.OK]
+    # *************************************************************************
+    # image server protocols
+    # *************************************************************************
 
-    def SendImageFileToLBTGuider(self,Filename,GuideHost,GuidePort):
+    def azcam_imageserver(self, localfile, remotefile=None):
         """
-        Send image to an LBT guider image server.
+        Send image to azcam image server.
+        The server replies with a status string when the file is received.
         """
 
-        # open image file on disk
-        gfile = open(Filename,'rb')	
-        if not gfile:
-            return [Globals.ERROR,'could not open local image file']
-
-        # get file size
-        lSize=os.path.getsize(Filename)
+        remotefile = self._remote_filename(remotefile)
 
-        # read the file into the buffer and close
-        buff=gfile.read()
-        gfile.close()
+        with self._connect("remote image server") as sock:
+            azcam.log(
+                f"Sending image to {self.remote_imageserver_host} as {remotefile}"
+            )
+            sock.sendall(self._dataserver_header(localfile, remotefile))
+            self._send_file(sock, localfile, "remote image server")
 
-        # open socket to LBT image server
-        GuideSocket=socket.socket(socket.AF_INET,socket.SOCK_STREAM)
-        GuideSocket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR,0)
+            # final return status
+            sock.settimeout(self.ack_timeout)
+            try:
+                reply = sock.recv(16).decode()
+            except OSError:
+                raise azcam.exceptions.AzcamError(
+                    "Did not receive return status from remote image server"
+                )
 
         try:
-            GuideSocket.connect((GuideHost,GuidePort))
-        except Exception,message:
-            GuideSocket.close()
-            return [Globals.ERROR,'LBT guider ImageServer not opened: %s' % message]	
+            retstat = int(reply[:1])
+        except ValueError:
+            retstat = -1
+        if retstat != 0:
+            raise azcam.exceptions.AzcamError(
+                "Bad final return status from remote image server"
+            )
+
+        return
 
-        # send filesize in bytes, \r\n terminated
-        sockBuf="%d\r\n" % lSize
-        l=len(sockBuf)
-        if GuideSocket.send(sockBuf) != len(sockBuf):
-            return [Globals.ERROR,'GuideSocket send error']
+    def dataserver(self, localfile, remotefile=None):
+        """
+        Send image to dataserver.
+        The dataserver sends no status, so wait for it to close the connection.
+        """
 
-        # send file data
-        if GuideSocket.send(buff) != len(buff):
-            return [Globals.ERROR,'could not send all image file data to LBT ImageServer']
+        remotefile = self._remote_filename(remotefile)
 
-        # close socket
-        GuideSocket.close()
+        with self._connect("remote dataserver") as sock:
+            azcam.log(
+                f"Sending image to {self.remote_imageserver_host} as {remotefile}"
+            )
+            sock.sendall(self._dataserver_header(localfile, remotefile))
+            self._send_file(sock, localfile, "remote dataserver")
+            self._wait_close(sock)
 
-        return [Globals.OK]    
+        return
 
-    def SendImageFileToCCDacq(self,RemoteImageServerHost,RemoteImageServerPort):
+    def lbtguider_imageserver(self, localfile, remotefile=None):
         """
-        Send raw image data to Skip's ccdacq program.    
+        Send image to an LBT guider image server.
         """
-        
-        # make sure data is valid
-        loop=0
-        while not self.image.isValid and loop<100:
-            loop=+1
-            time.sleep(.1)
-            if loop>=100:
-                Print('ERROR image data not received in time')
-        
-        # open socket to remote ImageServer
-        ImageServerSocket=socket.socket(socket.AF_INET,socket.SOCK_STREAM)
-        ImageServerSocket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR,0)
-        #ImageServerSocket.settimeout(10.)  # comment this out
-        try:
-            ImageServerSocket.connect((RemoteImageServerHost,RemoteImageServerPort))
-        except Exception,message:
-            ImageServerSocket.close()
-            return [Globals.ERROR,'remote ImageServer socket not opened: %s' % message]	
-
-        Print('Sending image to %s' % (RemoteImageServerHost))
-
-        # send header
-        s1='%d %d\r\n' % (self.image.SizeX,self.image.SizeY)
-        status=ImageServerSocket.send(s1)
-        if status <=0:
-            return[Globals.ERROR,'could not send image header to remote ImageServer']
-        
-        s1='NoFilename NoImageType\r\n'
-        status=ImageServerSocket.send(s1)
-        if status <=0:
-            return[Globals.ERROR,'could not send image header to remote ImageServer']
-        
-        # send image data
-        if GetObject('focalplane').NumAmpsImage>1:
-            self.image.isValid=1   #MIKE
-            #reply=self.image.WriteFile('/azcam/systems/maestro/image.fits',1)
-            reply=self.image.Assemble(0)
-            try:
-                reply=ImageServerSocket.send(self.image.Buffer)
-            except Exception,Message:
-                return [Globals.ERROR,'could not send image data to remote ImageServer:%s' % Message]
-        else:
-            try:
-                reply=ImageServerSocket.send(self.image.Data[0])
-            except Exception,Message:
-                return [Globals.ERROR,'could not send image data to remote ImageServer:%s' % Message]
-
-        if reply!=(self.image.SizeX*self.image.SizeY)*2:
-            return [Globals.ERROR,'did not send entire image to remote ImageServer']
-        
-        # wait before closing
-        try:
-            reply = ImageServerSocket.recv(1)
-        except Exception,message:
-            pass
-        
-        # close socket
-        ImageServerSocket.close()
-
-        Print('Finished sending image')
-
-        return [Globals.OK]
-    
-    def SendImageFileToMMTGuider(self,Filename,GuideHost,GuidePort):
+
+        with self._connect("LBT guider image server") as sock:
+            sock.sendall(str.encode("%d\r\n" % os.path.getsize(localfile)))
+            self._send_file(sock, localfile, "LBT guider image server")
+
+        return
+
+    def mmtguider_imageserver(self, localfile, remotefile=None):
         """
         Send image to an MMTO guider image server.
         """
-        
-        # open image file on disk
-        gfile = open(Filename,'rb')	
-        if not gfile:
-            return [Globals.ERROR,'could not open local image file']
 
-        # get file size
-        lSize=os.path.getsize(Filename)
+        with self._connect("MMT guider image server") as sock:
+            sock.sendall(str.encode("%d\r\n" % os.path.getsize(localfile)))
+            self._send_file(sock, localfile, "MMT guider image server")
 
-        # read the file into the buffer and close
-        buff=gfile.read()
-        gfile.close()
-
-        # open socket to LBT image server
-        GuideSocket=socket.socket(socket.AF_INET,socket.SOCK_STREAM)
-        GuideSocket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR,0)
-
-        try:
-            GuideSocket.connect((GuideHost,GuidePort))
-        except Exception,message:
-            GuideSocket.close()
-            return [Globals.ERROR,'MMT guider ImageServer not opened: %s' % message]	
-
-        # send filesize in bytes, \r\n terminated
-        sockBuf="%d\r\n" % lSize
-        l=len(sockBuf)
-        if GuideSocket.send(sockBuf) != len(sockBuf):
-            return [Globals.ERROR,'GuideSocket send error']
-
-        # send file data
-        if GuideSocket.send(buff) != len(buff):
-            return [Globals.ERROR,'could not send all image file data to MMT ImageServer']
-
-        # close socket
-        GuideSocket.close()
-
-        return [Globals.OK]  
-    
\ No newline at end of file
+        return
@@ -0,0 +1,137 @@
+"""
+Contains the BufferPool class which reuses image buffers across ROI changes.
+"""
+
+import collections
+import threading
+
+import numpy
+
+
+class BufferPool(object):
+    """
+    Pool of preallocated image buffers keyed by (amps, pixels per amp).
+    Each shape has up to depth buffers used in rotation, so a new readout
+    does not overwrite the previous frame while it may still be written,
+    sent or displayed. New buffers are touched when allocated so returning
+    to a recently used geometry costs no allocation or page faults. The
+    least recently used shapes are released when the pool exceeds max_bytes.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, dtype="<u2", depth=2):
+        # memory cap in bytes, the buffers of the most recent shape are always kept
+        self.max_bytes = max_bytes
+        self.dtype = dtype
+        # buffers per shape used in rotation
+        self.depth = depth
+
+        # {shape: [buffers]}, least recently used first
+        self.buffers = collections.OrderedDict()
+        # {shape: index of current buffer}
+        self.current = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._lock = threading.Lock()
+
+    def get(self, shape):
+        """
+        Return the current buffer for shape, allocating it if not in the pool.
+        """
+
+        shape = tuple(int(x) for x in shape)
+
+        with self._lock:
+            buffers = self._use(shape)
+            if buffers:
+                self.hits += 1
+            else:
+                self.misses += 1
+                buffers.append(self._allocate(shape))
+                self.current[shape] = 0
+                self._evict()
+
+            return buffers[self.current[shape]]
+
+    def next(self, shape):
+        """
+        Return the next buffer for shape in rotation, which is not the
+        buffer returned before unless depth is 1.
+        """
+
+        shape = tuple(int(x) for x in shape)
+
+        with self._lock:
+            buffers = self._use(shape)
+            index = (self.current.get(shape, -1) + 1) % self.depth
+            if index < len(buffers):
+                self.hits += 1
+            else:
+                self.misses += 1
+                buffers.append(self._allocate(shape))
+                index = len(buffers) - 1
+            self.current[shape] = index
+            self._evict()
+
+            return buffers[index]
+
+    def get_bytes(self):
+        """
+        Return bytes held by the pool.
+        """
+
+        return sum(buff.nbytes for buffers in self.buffers.values() for buff in buffers)
+
+    def clear(self):
+        """
+        Release all buffers.
+        """
+
+        with self._lock:
+            self.buffers.clear()
+            self.current.clear()
+
+        return
+
+    def get_stats(self):
+        """
+        Return pool contents and hit counters.
+        """
+
+        with self._lock:
+            return {
+                "shapes": [list(shape) for shape in self.buffers],
+                "buffers": sum(len(buffers) for buffers in self.buffers.values()),
+                "depth": self.depth,
+                "bytes": self.get_bytes(),
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def _use(self, shape):
+        """
+        Return the buffer list of shape, marking it most recently used.
+        """
+
+        buffers = self.buffers.pop(shape, [])
+        self.buffers[shape] = buffers
+
+        return buffers
+
+    def _allocate(self, shape):
+        buff = numpy.empty(shape, dtype=self.dtype)
+        buff.fill(0)  # touch all pages now rather than at readout
+
+        return buff
+
+    def _evict(self):
+        while len(self.buffers) > 1 and self.get_bytes() > self.max_bytes:
+            shape, _ = self.buffers.popitem(last=False)
+            self.current.pop(shape, None)
+            self.evictions += 1
+
+        return
@@ -4,16 +4,68 @@ Contains the ICE class for MMTO Blue Channel commands under ICE.
 
 import time
 
+import numpy
+
 import azcam
+import azcam.exceptions
+from azcam_bluechan import sendimage_ccdacq
+from azcam_bluechan.configcache import ConfigCache
+from azcam_bluechan.fanout import FanOut
+from azcam_bluechan.MMTCommandParser import format_reply, normalize
+from azcam_bluechan.parameterstore import ParameterStore
+from azcam_bluechan.progress import ProgressPush
+from azcam_bluechan.sendqueue import SendQueue
+from azcam_bluechan.telemetry import TemperatureSampler
+
+# parameters set before each expose, written only when changed
+EXPOSE_PARAMETERS = {
+    "imagetest": 0,
+    "imageautoname": 0,
+    "imageincludesequencenumber": 0,
+    "imageautoincrementsequencenumber": 0,
+}
+
+# focalplane attributes set by each configuration
+CONFIG_ATTRIBUTES = {
+    "format": (
+        "ns_total",
+        "ns_predark",
+        "ns_underscan",
+        "ns_overscan",
+        "np_total",
+        "np_predark",
+        "np_underscan",
+        "np_overscan",
+        "np_frametransfer",
+    ),
+    "focalplane": ("numdet_x", "numdet_y", "numamps_x", "numamps_y", "amp_cfg"),
+    "roi": ("first_col", "last_col", "first_row", "last_row", "col_bin", "row_bin"),
+}
 
 """
-    ** Get camtemp
-    ** Get dewtemp
+    ** Get camtemp (last background sample)
+    ** Get dewtemp (last background sample)
+    ** Get temperatures (last sample with age in seconds)
     ** Get utc-obs (only after an exposure as reads header)
-    ** Get pixelcount
+    ** Get pixelcount (pixels received for current frame)
+    ** Get progress
+    ** Get parameters
+    ** Get config
+    ** Get connections
+    ** Get sendstatus
+    ** Get transfers
+    ** Get destinations
+    ** Get bufferpool
+    ** Get headers
+    ** Get headerprefetch
+    ** Get timing
+    ** Get rowsread
+    ** Get preview
 
     ** Set ReadOutMode wait
     ** Set ShutterState
+    ** Set SendMode wait|async|stream
+    ** Set TempPeriod seconds
 
     ** SetFormat
     ** SetConfiguration
@@ -28,8 +80,16 @@ import azcam
     ** AbortExposure
 
     ** SendImage 3
+    ** AddDestination name host port
+    ** RemoveDestination name
     ** ReadImage 0
 
+    ** Subscribe host port [rate]
+    ** Unsubscribe host port
+
+    ** Batch command [args] ; command [args] ; ...
+    ** WriteTiming filename
+
     ** ClearArray
     ** CloseConnection
     ** Reset
@@ -58,6 +118,85 @@ class CCDACQ(object):
         self.imagetype = "dark"  # shutter state for exposure
         self.status = "OK"
 
+        # sendimage mode: "wait", "async" (background queue) or "stream" (during readout)
+        self.send_mode = "wait"
+        self.send_queue = SendQueue()
+
+        # additional destinations which receive every frame sent
+        self.fanout = FanOut()
+
+        # last sendimage destination, used for streamed readouts
+        self.send_host = ""
+        self.send_port = 0
+
+        # temperatures read in the background for camtemp and dewtemp
+        self.temperature_sampler = TemperatureSampler()
+
+        # parameters applied only when changed
+        self.parameter_store = ParameterStore()
+
+        # format, ROI and gain applied to the controller at the next exposure
+        self.config_cache = ConfigCache(self._get_config_state)
+        exposure = azcam.db.tools.get("exposure")
+        if exposure is not None:
+            exposure.config_cache = self.config_cache
+
+        # clients sent exposure progress, created on first subscribe
+        self.progress_push = None
+
+        # get attributes {attribute: method returning value}
+        self.get_attributes = {
+            "camtemp": self._get_camtemp,
+            "dewtemp": self._get_dewtemp,
+            "pixelcount": self._get_pixelcount,
+            "utc-obs": self._get_utcobs,
+            "connections": self._get_connections,
+            "sendstatus": self._get_sendstatus,
+            "destinations": self._get_destinations,
+            "bufferpool": self._get_bufferpool,
+            "headers": self._get_headers,
+            "headerprefetch": self._get_headerprefetch,
+            "rowsread": self._get_rowsread,
+            "preview": self._get_preview,
+            "timing": self._get_timing,
+            "transfers": self._get_transfers,
+            "temperatures": self._get_temperatures,
+            "progress": self._get_progress,
+            "parameters": self._get_parameters,
+            "config": self._get_config,
+        }
+
+        # set attributes {attribute: method taking value}
+        self.set_attributes = {
+            "readoutmode": self._set_readoutmode,
+            "shutterstate": self._set_shutterstate,
+            "sendmode": self._set_sendmode,
+            "tempperiod": self._set_tempperiod,
+        }
+
+        # commands which may be run by batch {command: method}
+        self.batch_commands = {
+            name: getattr(self, name)
+            for name in [
+                "get",
+                "set",
+                "setformat",
+                "setconfiguration",
+                "setroi",
+                "setgainspeed",
+                "setexposure",
+                "setparameter",
+                "readexposure",
+                "startexposure",
+                "readimage",
+                "sendimage",
+                "cleararray",
+                "parshift",
+                "adddestination",
+                "removedestination",
+            ]
+        }
+
         return
 
     def expose(self, flag, exposuretime, filename):
@@ -68,10 +207,8 @@ class CCDACQ(object):
         filename is remote filename (do not use periods)
         """
 
-        azcam.db.parameters.set_par("imagetest", 0)
-        azcam.db.parameters.set_par("imageautoname", 0)
-        azcam.db.parameters.set_par("imageincludesequencenumber", 0)
-        azcam.db.parameters.set_par("imageautoincrementsequencenumber", 0)
+        self._check_send_queue()
+        self.parameter_store.set_pars(EXPOSE_PARAMETERS)
 
         azcam.db.tools["exposure"].set_filename(filename)
         azcam.db.tools["exposure"].expose(
@@ -88,10 +225,8 @@ class CCDACQ(object):
         filename is remote filename (do not use periods)
         """
 
-        azcam.db.parameters.set_par("imagetest", 0)
-        azcam.db.parameters.set_par("imageautoname", 0)
-        azcam.db.parameters.set_par("imageincludesequencenumber", 0)
-        azcam.db.parameters.set_par("imageautoincrementsequencenumber", 0)
+        self._check_send_queue()
+        self.parameter_store.set_pars(EXPOSE_PARAMETERS)
 
         azcam.db.tools["exposure"].set_filename(filename)
         azcam.db.tools["exposure"].expose1(
@@ -102,14 +237,42 @@ class CCDACQ(object):
 
     def reset(self):
         azcam.db.tools["exposure"].reset()
+        self.config_cache.clear()
         return self.status
 
     def readimage(self,flag=-1):
+        self._check_send_queue()
+        receive_data = azcam.db.tools["exposure"].receive_data
+        if hasattr(receive_data, "set_stream"):
+            if self.send_mode == "stream":
+                receive_data.set_stream(self.send_host, self.send_port)
+            else:
+                receive_data.set_stream()
         azcam.db.tools["exposure"].dark_time = time.time() - azcam.db.tools["exposure"].dark_time_start
         azcam.db.tools["exposure"].readout()
         azcam.db.tools["exposure"].end()
         return self.status
 
+    def _check_send_queue(self):
+        """
+        Refuse a readout when frames are sent in the background and the
+        send queue has no room for the frame.
+        """
+
+        if self.send_mode == "async" and self.send_queue.is_full():
+            raise azcam.exceptions.AzcamError(
+                "ccdacq send queue is full, readout refused"
+            )
+
+        return
+
+    def writetiming(self, filename):
+        """
+        Write the stored exposure timelines to a CSV file.
+        """
+        azcam.db.tools["exposure"].timeline.write_csv(filename)
+        return self.status
+
     def abortexposure(self):
         azcam.db.tools["exposure"].abort()
         return self.status
@@ -132,45 +295,217 @@ class CCDACQ(object):
         return self.status
 
     def get(self, attribute):
+        """
+        Return the value of attribute, or status if attribute is unknown.
+        """
 
-        if attribute == "camtemp":
-            temp = azcam.db.tools["tempcon"].get_temperatures()[0]
-            reply = temp
-        elif attribute == "dewtemp":
-            temp = azcam.db.tools["tempcon"].get_temperatures()[1]
-            reply = temp
-        elif attribute == "pixelcount":
-            count = azcam.db.tools["exposure"].get_pixels_remaining()
-            reply = azcam.db.tools["exposure"].image.focalplane.numpix_image - count
-        elif attribute == "utc-obs":
-            reply = azcam.db.tools["exposure"].header.get_keyword("UTC-OBS")[0]
-        else:
-            reply = self.status
+        method = self.get_attributes.get(attribute)
+        if method is None:
+            return self.status
 
-        return reply
+        return method()
 
     def set(self, attribute, value):
+        """
+        Set attribute to value, unknown attributes are ignored.
+        """
+
+        method = self.set_attributes.get(attribute)
+        if method is not None:
+            method(value)
 
-        if attribute == "readoutmode":  # ignored
-            pass
-        elif attribute == "shutterstate":
-            if value == "open":
-                self.imagetype = "object"
-            else:
-                self.imagetype = "dark"
         return self.status
 
+    def batch(self, *args):
+        """
+        Run several commands in one request, in order.
+        Commands are separated by ";" with the same arguments as when sent alone:
+        ccdacq.batch setexposure 1000 ; setroi 1 2688 1 512 1 1 ; startexposure 0
+        Returns the replies separated by "; ", stopping at the first error.
+        """
+
+        commands = [[]]
+        for token in args:
+            if token[:1] in ["'", '"']:
+                commands[-1].append(token)
+                continue
+            for i, part in enumerate(token.split(";")):
+                if i > 0:
+                    commands.append([])
+                if part != "":
+                    commands[-1].append(part)
+
+        replies = []
+        error = 0
+        for tokens in commands:
+            if len(tokens) == 0:
+                continue
+            name, args = normalize(tokens)
+            method = self.batch_commands.get(name)
+            try:
+                if method is None:
+                    raise azcam.exceptions.AzcamError(
+                        f"command not allowed in batch: {tokens[0]}"
+                    )
+                reply = format_reply(method(*args))
+            except Exception as e:
+                reply = f"ERROR {e}"
+            replies.append(reply)
+            if reply.startswith("ERROR"):
+                error = 1
+                break
+
+        reply = "; ".join(replies)
+        if reply == "":
+            reply = "ERROR no commands"
+        elif error and not reply.startswith("ERROR"):
+            reply = f"ERROR {reply}"
+
+        return reply
+
+    # *************************************************************************
+    # get and set attributes
+    # *************************************************************************
+
+    def _get_camtemp(self):
+        return self._get_temperature(0)
+
+    def _get_dewtemp(self):
+        return self._get_temperature(1)
+
+    def _get_temperature(self, index):
+        try:
+            return self.temperature_sampler.get_temperature(index)
+        except azcam.exceptions.AzcamError as e:
+            return f"ERROR {e}"
+
+    def _get_temperatures(self):
+        return self.temperature_sampler.get_stats()
+
+    def _get_pixelcount(self):
+        return azcam.db.tools["exposure"].progress.get_pixels()
+
+    def _get_utcobs(self):
+        return azcam.db.tools["exposure"].header.get_keyword("UTC-OBS")[0]
+
+    def _get_connections(self):
+        return sendimage_ccdacq.connections.get_stats()
+
+    def _get_sendstatus(self):
+        return self.send_queue.get_status()
+
+    def _get_destinations(self):
+        return self.fanout.get_status()
+
+    def _get_bufferpool(self):
+        return azcam.db.tools["exposure"].buffer_pool.get_stats()
+
+    def _get_headers(self):
+        image = azcam.db.tools["exposure"].image
+        reply = image.header_cache.get_stats()
+        reply["header_time"] = image.header_time
+        return reply
+
+    def _get_headerprefetch(self):
+        return azcam.db.tools["exposure"].header_prefetch.get_stats()
+
+    def _get_rowsread(self):
+        return azcam.db.tools["exposure"].receive_data.get_rows().shape[0]
+
+    def _get_preview(self):
+        preview = azcam.db.tools["exposure"].receive_data.get_preview()
+        return preview.astype(int).tolist()
+
+    def _get_timing(self):
+        timeline = azcam.db.tools["exposure"].timeline
+        return {
+            "summary": timeline.get_summary(),
+            "last": timeline.get_timing(10),
+        }
+
+    def _get_progress(self):
+        reply = azcam.db.tools["exposure"].progress.get_status()
+        reply["clients"] = (
+            [] if self.progress_push is None else self.progress_push.get_clients()
+        )
+        return reply
+
+    def _get_parameters(self):
+        return self.parameter_store.get_stats()
+
+    def _get_config(self):
+        return self.config_cache.get_stats()
+
+    def _get_config_state(self, name):
+        """
+        Return the current state of a configuration, as seen by the exposure tool.
+        """
+
+        if name == "gain":
+            return getattr(azcam.db.tools["controller"], "video_gain", None)
+
+        focalplane = azcam.db.tools["exposure"].image.focalplane
+        return tuple(
+            str(getattr(focalplane, attribute, None))
+            for attribute in CONFIG_ATTRIBUTES[name]
+        )
+
+    def _get_transfers(self):
+        return {
+            "summary": sendimage_ccdacq.transfers.get_summary(),
+            "last": sendimage_ccdacq.transfers.get_transfers(10),
+        }
+
+    def _set_readoutmode(self, value):
+        pass  # ignored
+
+    def _set_shutterstate(self, value):
+        if value == "open":
+            self.imagetype = "object"
+        else:
+            self.imagetype = "dark"
+
+    def _set_sendmode(self, value):
+        value = value.lower()
+        if value not in ["wait", "async", "stream"]:
+            raise azcam.exceptions.AzcamError(f"invalid sendmode {value}")
+        self.send_mode = value
+
+    def _set_tempperiod(self, value):
+        self.temperature_sampler.set_period(value)
+
     def setexposure(self, exposure_time):
         et = float(exposure_time) / 1000.0  #  msec to sec
         azcam.db.tools["exposure"].set_exposuretime(et)
         return self.status
 
     def readexposure(self):
-        etr = azcam.db.tools["exposure"].get_exposuretime_remaining()
-        et = max(0, int(etr * 1000) - 3)  #  sec to msec
-        reply =  int(azcam.db.tools["exposure"].exposure_time*1000.) - et
+        elapsed = azcam.db.tools["exposure"].progress.get_elapsed()
+        reply = int(elapsed * 1000.)  #  sec to msec
         return reply
 
+    def subscribe(self, host, port, rate=2):
+        """
+        Send exposure progress to a client at host:port rate times per second.
+        Each update is a line "<elapsed msec> <pixels read> <state>".
+        """
+
+        if self.progress_push is None:
+            self.progress_push = ProgressPush(azcam.db.tools["exposure"].progress)
+        self.progress_push.subscribe(host, port, rate)
+
+        return self.status
+
+    def unsubscribe(self, host, port):
+        """
+        Stop sending exposure progress to host:port.
+        """
+
+        if self.progress_push is not None:
+            self.progress_push.unsubscribe(host, port)
+
+        return self.status
+
     def setformat(
         self,
         ns_total=-1,
@@ -184,7 +519,9 @@ class CCDACQ(object):
         np_frametransfer=-1,
     ):
 
-        azcam.db.tools["exposure"].set_format(
+        self.config_cache.request(
+            "format",
+            azcam.db.tools["exposure"].set_format,
             int(ns_total),
             int(ns_predark),
             int(ns_underscan),
@@ -202,8 +539,8 @@ class CCDACQ(object):
         self, numdet_x=-1, numdet_y=-1, numamps_x=-1, numamps_y=-1, amp_config=""
     ):
 
-        azcam.db.tools["exposure"].set_focalplane(
-            1, 1, 1, 1, "0"
+        self.config_cache.request(
+            "focalplane", azcam.db.tools["exposure"].set_focalplane, 1, 1, 1, 1, "0"
         )
 
         return self.status
@@ -218,7 +555,9 @@ class CCDACQ(object):
         row_bin=-1,
     ):
 
-        azcam.db.tools["exposure"].set_roi(
+        self.config_cache.request(
+            "roi",
+            azcam.db.tools["exposure"].set_roi,
             int(first_col),
             int(last_col),
             int(first_row),
@@ -231,7 +570,9 @@ class CCDACQ(object):
 
     def setgainspeed(self, gain, speed):
         gain = int(gain)
-        azcam.db.tools["controller"].set_video_gain(gain)
+        self.config_cache.request(
+            "gain", azcam.db.tools["controller"].set_video_gain, gain
+        )
         # azcam.db.tools["controller"].set_video_speed(speed)
         return self.status
 
@@ -241,11 +582,65 @@ class CCDACQ(object):
         return self.status
 
     def sendimage(self, flag, host, port):
+        exposure = azcam.db.tools["exposure"]
+        self.send_host = host
+        self.send_port = int(port)
+
+        # wait for a readout in progress, otherwise send the current data
+        events = exposure.frame_events
+        if exposure.exposure_flag in (
+            exposure.exposureflags["READ"],
+            exposure.exposureflags["READOUT"],
+        ):
+            if not events.wait("valid", exposure.valid_timeout):
+                raise azcam.exceptions.AzcamError("image data not received in time")
+        frame = events.frame
+
+        if self.send_mode == "async":
+            # copy as the next readout reuses image.data, shared with fanout
+            buff = numpy.array(exposure.image.data[0], copy=True)
+            self.send_queue.submit(
+                host,
+                port,
+                exposure.size_x,
+                exposure.size_y,
+                buff,
+                lambda record: events.publish(
+                    "sent", frame=frame, destination=record["destination"]
+                ),
+            )
+            self.fanout.send(exposure.size_x, exposure.size_y, buff, copy=False)
+            return self.status
+
+        # additional destinations are sent in the background
+        self.fanout.send(exposure.size_x, exposure.size_y, exposure.image.data[0])
+
+        if self.send_mode == "stream":
+            # already delivered during readout
+            receive_data = exposure.receive_data
+            if getattr(receive_data, "streamed", 0) and (
+                receive_data.stream_host,
+                receive_data.stream_port,
+            ) == (host, int(port)):
+                events.publish("sent", frame=frame, destination=f"{host}:{port}")
+                return self.status
+
         azcam.db.tools["sendimage"].set_remote_imageserver(host, int(port),"ccdacq")
         localfile = azcam.db.tools["exposure"].get_filename()
         azcam.db.tools["sendimage"].send_image(localfile)
         return self.status
 
+    def adddestination(self, name, host, port):
+        """
+        Add a destination which receives a copy of every frame sent by sendimage.
+        """
+        self.fanout.add_destination(name, host, int(port))
+        return self.status
+
+    def removedestination(self, name):
+        self.fanout.remove_destination(name)
+        return self.status
+
     def setparameter(self, keyword, value, comment):
         azcam.db.tools["exposure"].set_keyword(keyword, value, comment)
         return self.status
@@ -265,6 +660,8 @@ class CCDACQ(object):
         # below is for immediate return
         exposure.exposure_flag = exposure.exposureflags["EXPOSING"]
         exposure.dark_time_start = time.time()
+        exposure.timeline.start_phase("integrate")
         azcam.db.tools["controller"].start_exposure()
+        exposure.progress.start(exposure.exposure_time)
 
         return self.status
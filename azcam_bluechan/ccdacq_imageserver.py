@@ -0,0 +1,258 @@
+"""
+Contains the CcdacqImageServer class, a local stand-in for the ccdacq image server.
+
+Run from the command line with:
+python -m azcam_bluechan.ccdacq_imageserver -port 6543 -latency 0.0 -bandwidth 0
+or benchmark the send path with:
+python -m azcam_bluechan.ccdacq_imageserver -benchmark 20
+"""
+
+import socket
+import sys
+import threading
+import time
+
+import numpy
+
+
+class CcdacqImageServer(object):
+    """
+    Receives frames using the ccdacq protocol:
+    "size_x size_y\\r\\n", "NoFilename NoImageType\\r\\n", raw u2 pixels,
+    then replies with a 1-byte acknowledgement.
+    Several frames may be sent on one connection.
+    """
+
+    def __init__(self, host="localhost", port=6543, expected_shape=None):
+        self.host = host
+        self.port = int(port)
+
+        # (size_x, size_y) to validate against, None to accept any size
+        self.expected_shape = expected_shape
+
+        # seconds to wait before each acknowledgement
+        self.latency = 0.0
+        # maximum receive rate in bytes/sec, 0 for no limit
+        self.bandwidth = 0
+
+        # receive buffer size in bytes
+        self.chunksize = 256 * 1024
+
+        # one record per frame received
+        self.frames = []
+        # pixels of last frame as a (size_y, size_x) array
+        self.last_image = None
+
+        self.socket = None
+        self.is_running = 0
+        self._thread = None
+
+    def start(self):
+        """
+        Start listening in a background thread.
+        If port is 0 a free port is chosen and stored in self.port.
+        """
+
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.bind((self.host, self.port))
+        self.socket.listen(5)
+        self.port = self.socket.getsockname()[1]
+
+        self.is_running = 1
+        self._thread = threading.Thread(
+            target=self._serve, name="ccdacq_imageserver", daemon=True
+        )
+        self._thread.start()
+
+        return
+
+    def stop(self):
+        """
+        Stop listening.
+        """
+
+        self.is_running = 0
+        if self.socket is not None:
+            self.socket.close()
+            self.socket = None
+
+        return
+
+    def _serve(self):
+        while self.is_running:
+            try:
+                conn, _ = self.socket.accept()
+            except OSError:
+                break
+            threading.Thread(
+                target=self._handle, args=[conn], name="ccdacq_client", daemon=True
+            ).start()
+
+        return
+
+    def _handle(self, conn):
+        """
+        Receive frames on one connection until the client closes it.
+        """
+
+        rfile = conn.makefile("rb")
+        try:
+            while self.is_running:
+                line = rfile.readline()
+                if not line:
+                    break
+                t0 = time.monotonic()
+                size_x, size_y = [int(x) for x in line.split()]
+                rfile.readline()  # NoFilename NoImageType
+
+                data = bytearray(size_x * size_y * 2)
+                numbytes = self._receive(rfile, data)
+                self._record(size_x, size_y, data, numbytes, time.monotonic() - t0)
+
+                if self.latency > 0:
+                    time.sleep(self.latency)
+                conn.sendall(b"1")
+        except (OSError, ValueError):
+            pass
+        finally:
+            rfile.close()
+            conn.close()
+
+        return
+
+    def _receive(self, rfile, data):
+        """
+        Fill data from the stream, honouring the bandwidth cap.
+        Returns the number of bytes received.
+        """
+
+        view = memoryview(data)
+        numbytes = 0
+        t0 = time.monotonic()
+        while numbytes < len(data):
+            n = rfile.readinto(view[numbytes : numbytes + self.chunksize])
+            if not n:
+                break
+            numbytes += n
+            if self.bandwidth > 0:
+                ahead = numbytes / self.bandwidth - (time.monotonic() - t0)
+                if ahead > 0:
+                    time.sleep(ahead)
+
+        return numbytes
+
+    def _record(self, size_x, size_y, data, numbytes, dt):
+        valid = numbytes == len(data)
+        if self.expected_shape is not None:
+            valid = valid and (size_x, size_y) == tuple(self.expected_shape)
+
+        self.frames.append(
+            {
+                "size_x": size_x,
+                "size_y": size_y,
+                "bytes": numbytes,
+                "receive_time": dt,
+                "rate": numbytes / dt if dt > 0 else 0.0,
+                "valid": valid,
+            }
+        )
+        if valid:
+            self.last_image = numpy.frombuffer(data, dtype="<u2").reshape(
+                size_y, size_x
+            )
+
+        return
+
+    def get_stats(self):
+        """
+        Return a summary of the frames received.
+        """
+
+        numframes = len(self.frames)
+        numbytes = sum(f["bytes"] for f in self.frames)
+        dt = sum(f["receive_time"] for f in self.frames)
+
+        return {
+            "frames": numframes,
+            "invalid": sum(1 for f in self.frames if not f["valid"]),
+            "bytes": numbytes,
+            "mean_time": dt / numframes if numframes else 0.0,
+            "rate": numbytes / dt if dt > 0 else 0.0,
+        }
+
+
+def benchmark(
+    number_frames=10,
+    size_x=2688,
+    size_y=512,
+    latency=0.0,
+    bandwidth=0,
+    imagetype="bias",
+):
+    """
+    Send synthetic frames through send_frame() to a local CcdacqImageServer and
+    return (server stats, frames/sec).
+    """
+
+    from azcam_bluechan.sendimage_ccdacq import send_frame
+    from azcam_bluechan.synthetic import SyntheticImage
+
+    server = CcdacqImageServer("localhost", 0, (size_x, size_y))
+    server.latency = latency
+    server.bandwidth = bandwidth
+    server.start()
+
+    frames = SyntheticImage().frames(imagetype, number_frames, size_x, size_y, 20)
+
+    t0 = time.monotonic()
+    for buff in frames:
+        send_frame("localhost", server.port, size_x, size_y, buff)
+    dt = time.monotonic() - t0
+
+    server.stop()
+
+    if server.last_image is None or not numpy.array_equal(server.last_image, buff):
+        raise RuntimeError("frame data received does not match data sent")
+
+    return server.get_stats(), number_frames / dt
+
+
+def main():
+    args = sys.argv
+    port = int(args[args.index("-port") + 1]) if "-port" in args else 6543
+    latency = float(args[args.index("-latency") + 1]) if "-latency" in args else 0.0
+    bandwidth = float(args[args.index("-bandwidth") + 1]) if "-bandwidth" in args else 0
+
+    if "-benchmark" in args:
+        number_frames = int(args[args.index("-benchmark") + 1])
+        stats, fps = benchmark(number_frames, latency=latency, bandwidth=bandwidth)
+        print(f"{stats['frames']} frames, {fps:.1f} frames/sec")
+        print(f"{stats['rate'] / 1.0e6:.1f} MB/sec receive rate")
+        return
+
+    server = CcdacqImageServer("0.0.0.0", port)
+    server.latency = latency
+    server.bandwidth = bandwidth
+    server.start()
+    print(f"ccdacq image server listening on port {server.port}")
+
+    count = 0
+    try:
+        while 1:
+            time.sleep(1)
+            if len(server.frames) > count:
+                count = len(server.frames)
+                f = server.frames[-1]
+                print(
+                    f"{len(server.frames)} frames, last {f['size_x']}x{f['size_y']} "
+                    f"{f['receive_time']:.3f} sec valid={f['valid']}"
+                )
+    except KeyboardInterrupt:
+        server.stop()
+
+    return
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+Contains the ConfigCache class which applies only changed detector configurations.
+"""
+
+import time
+
+
+class ConfigCache(object):
+    """
+    Last detector format, focal plane, ROI and gain applied to the controller.
+    A request with the arguments last applied is a no-op, provided the
+    current state returned by get_state(name) is still the state recorded
+    when they were applied, so changes made outside the cache (other
+    clients, tools or resets) are not hidden.
+    Changed requests are held until apply(), normally at the start of the
+    next exposure, and then applied together in one controller update.
+    """
+
+    # configurations in the order they are applied
+    order = ("format", "focalplane", "roi", "gain")
+
+    # configurations after which the ROI must be applied again
+    requires_roi = ("format", "focalplane")
+
+    # configurations which set the image geometry
+    geometry = ("format", "focalplane", "roi")
+
+    def __init__(self, get_state=None):
+        # get_state(name) returns the current state of a configuration
+        self.get_state = get_state
+
+        # {name: args} last applied and waiting to be applied
+        self.applied = {}
+        self.pending = {}
+        # {name: state} recorded after each configuration was applied
+        self.states = {}
+        # {name: method} applying each configuration
+        self.setters = {}
+
+        self.requests = 0
+        self.skipped = 0
+        self.updates = 0
+        self.last_applied = []
+        self.apply_time = 0.0
+
+    def request(self, name, setter, *args):
+        """
+        Request configuration name be set with setter(*args).
+        Returns True if it differs from the configuration applied.
+        """
+
+        self.requests += 1
+        self.setters[name] = setter
+
+        if self.applied.get(name) == args and self._state(name) == self.states.get(
+            name
+        ):
+            self.pending.pop(name, None)
+            self.skipped += 1
+            return False
+
+        self.pending[name] = args
+
+        return True
+
+    def apply(self, names=None):
+        """
+        Apply pending configurations in order, only those in names if given.
+        Returns the list of configurations applied.
+        """
+
+        names = self.order if names is None else names
+        if not any(name in self.pending for name in names):
+            return []
+
+        t0 = time.perf_counter()
+
+        if (
+            any(name in self.pending and name in names for name in self.requires_roi)
+            and "roi" not in self.pending
+            and "roi" in self.applied
+        ):
+            self.pending["roi"] = self.applied["roi"]
+
+        applied = []
+        for name in self.order:
+            if name not in self.pending or name not in names:
+                continue
+            args = self.pending[name]
+            self.setters[name](*args)
+            self.applied[name] = args
+            del self.pending[name]
+            self.states[name] = self._state(name)
+            applied.append(name)
+
+        self.updates += 1
+        self.last_applied = applied
+        self.apply_time = time.perf_counter() - t0
+
+        return applied
+
+    def clear(self):
+        """
+        Forget the configurations applied, as after a controller reset,
+        so the next requests are applied.
+        """
+
+        for name, args in self.applied.items():
+            self.pending.setdefault(name, args)
+        self.applied = {}
+        self.states = {}
+
+        return
+
+    def _state(self, name):
+        if self.get_state is None:
+            return None
+
+        return self.get_state(name)
+
+    def get_stats(self):
+        """
+        Return configuration requests, skipped requests and controller updates.
+        """
+
+        return {
+            "requests": self.requests,
+            "skipped": self.skipped,
+            "updates": self.updates,
+            "pending": list(self.pending),
+            "last_applied": self.last_applied,
+            "apply_time": self.apply_time,
+        }
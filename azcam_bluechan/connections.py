@@ -0,0 +1,184 @@
+"""
+Contains the ConnectionPool class for persistent image server connections.
+"""
+
+import select
+import socket
+import threading
+
+import azcam
+import azcam.exceptions
+
+
+class Connection(object):
+    """
+    A persistent TCP connection to one image server destination.
+    The socket is kept open between frames and checked before each reuse.
+    """
+
+    def __init__(self, host, port, timeout=10.0):
+        self.host = host
+        self.port = int(port)
+        self.timeout = timeout
+
+        self.socket = None
+
+        # held by a sender for the whole transfer of one frame
+        self.lock = threading.Lock()
+
+        # counters
+        self.connects = 0
+        self.reconnects = 0
+        self.reuses = 0
+        self.failures = 0
+        self.frames = 0
+
+    def is_alive(self):
+        """
+        Return True if the socket is open and the peer has not closed it.
+        """
+
+        if self.socket is None:
+            return False
+
+        try:
+            readable, _, _ = select.select([self.socket], [], [], 0)
+        except (OSError, ValueError):
+            return False
+
+        if not readable:
+            return True
+
+        # readable with no pending data means the peer closed the connection
+        try:
+            data = self.socket.recv(1, socket.MSG_PEEK)
+        except OSError:
+            return False
+
+        return len(data) > 0
+
+    def connect(self):
+        """
+        Open a new socket to the destination.
+        """
+
+        try:
+            self.socket = socket.create_connection(
+                (self.host, self.port), timeout=self.timeout
+            )
+        except OSError as message:
+            self.socket = None
+            self.failures += 1
+            raise azcam.exceptions.AzcamError(
+                f"image server {self.host}:{self.port} not opened: {message}"
+            )
+
+        self.socket.settimeout(None)
+        self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        self.connects += 1
+
+        return
+
+    def acquire(self):
+        """
+        Return a connected socket, reusing the open one if it is still alive.
+        Caller must hold self.lock.
+        """
+
+        if self.is_alive():
+            self.reuses += 1
+            return self.socket
+
+        if self.socket is not None:
+            self.reconnects += 1
+            self.close()
+
+        self.connect()
+
+        return self.socket
+
+    def discard(self):
+        """
+        Close the socket after an error so the next acquire() reconnects.
+        """
+
+        self.failures += 1
+        self.close()
+
+        return
+
+    def close(self):
+        """
+        Close the socket.
+        """
+
+        if self.socket is not None:
+            try:
+                self.socket.close()
+            except OSError:
+                pass
+            self.socket = None
+
+        return
+
+    def get_stats(self):
+        """
+        Return a dictionary of connection counters.
+        """
+
+        return {
+            "connected": int(self.socket is not None),
+            "connects": self.connects,
+            "reconnects": self.reconnects,
+            "reuses": self.reuses,
+            "failures": self.failures,
+            "frames": self.frames,
+        }
+
+
+class ConnectionPool(object):
+    """
+    Persistent connections keyed by (host, port).
+    """
+
+    def __init__(self, timeout=10.0):
+        self.timeout = timeout
+        self.connections = {}
+        self._lock = threading.Lock()
+
+    def get(self, host, port):
+        """
+        Return the Connection for a destination, creating it if needed.
+        """
+
+        key = (host, int(port))
+        with self._lock:
+            connection = self.connections.get(key)
+            if connection is None:
+                connection = Connection(host, port, self.timeout)
+                self.connections[key] = connection
+
+        return connection
+
+    def close_all(self):
+        """
+        Close all open connections.
+        """
+
+        with self._lock:
+            for connection in self.connections.values():
+                connection.close()
+
+        return
+
+    def get_stats(self):
+        """
+        Return counters for all destinations as {"host:port": stats}.
+        """
+
+        with self._lock:
+            return {
+                f"{host}:{port}": connection.get_stats()
+                for (host, port), connection in self.connections.items()
+            }
@@ -0,0 +1,559 @@
+"""
+Contains the ExposureBlueChan class for the MMTO Blue Channel camera.
+"""
+
+import threading
+import time
+
+import numpy
+
+import azcam
+import azcam.exceptions
+from azcam.tools.arc.exposure_arc import ExposureArc
+
+from azcam_bluechan import sendimage_ccdacq
+from azcam_bluechan.bufferpool import BufferPool
+from azcam_bluechan.frameevents import FrameEvents
+from azcam_bluechan.headerprefetch import HeaderPrefetch
+from azcam_bluechan.image_bluechan import ImageBlueChan
+from azcam_bluechan.progress import ExposureProgress
+from azcam_bluechan.SendImage import SendImage
+from azcam_bluechan.timeline import Timeline
+
+
+class ExposureBlueChan(ExposureArc):
+    """
+    Exposure tool for Blue Channel, an ARC exposure with additions for ccdacq.
+    """
+
+    def __init__(self, tool_id="exposure", description=None):
+        super().__init__(tool_id, description)
+
+        # timeline of the phases of each exposure
+        self.timeline = Timeline()
+
+        # image with cached header assembly
+        self.image = ImageBlueChan()
+        self.image.timeline = self.timeline
+
+        # streaming image sender for all remote image server types
+        self.sendimage = SendImage()
+        azcam.db.tools["sendimage"] = self.sendimage
+
+        # set whenever abort, pause, resume or readout changes exposure_flag
+        self.flag_event = threading.Event()
+        # seconds to wait past the local deadline for the controller timer
+        self.integration_guard = 0.1
+
+        # frame lifecycle events: readout, rows, valid, written, sent
+        self.frame_events = FrameEvents()
+        # seconds to wait for image data to be valid before writing or sending
+        self.valid_timeout = 5.0
+        # local integration and readout progress
+        self.progress = ExposureProgress(self.frame_events)
+
+        # image data buffers reused across ROI and binning changes
+        self.buffer_pool = BufferPool()
+
+        # ConfigCache applied at the start of each exposure, set by ccdacq
+        self.config_cache = None
+
+        # True to update slow header sources in the background during integration
+        self.prefetch_headers = 1
+        self.header_prefetch = HeaderPrefetch()
+
+        # True to overlap sending guide frame N with integrating frame N+1
+        self.guide_pipeline = 1
+        # seconds to wait for the last guide frame to be sent after the loop
+        self.guide_timeout = 10.0
+        # guide frames completed and rate of last/current guide loop
+        self.guide_frames = 0
+        self.guide_rate = 0.0  # frames per minute
+
+        self._guide_buffers = []
+        self._guide_thread = None
+
+    # **************************************************************************
+    # exposure control
+    # **************************************************************************
+
+    def abort(self):
+        super().abort()
+        self.progress.stop()
+        self.flag_event.set()
+
+        return
+
+    def pause(self):
+        super().pause()
+        self.progress.pause()
+        self.flag_event.set()
+
+        return
+
+    def resume(self):
+        super().resume()
+        self.progress.resume()
+        self.flag_event.set()
+
+        return
+
+    def start_readout(self):
+        super().start_readout()
+        self.flag_event.set()
+
+        return
+
+    def set_roi(
+        self,
+        first_col=-1,
+        last_col=-1,
+        first_row=-1,
+        last_row=-1,
+        col_bin=-1,
+        row_bin=-1,
+        roi_num=0,
+    ):
+        """
+        Sets the ROI values for subsequent exposures.
+        The image buffer for the new geometry is taken from the buffer pool,
+        so begin() does not allocate a new one.
+        """
+
+        super().set_roi(
+            first_col, last_col, first_row, last_row, col_bin, row_bin, roi_num
+        )
+
+        focalplane = self.image.focalplane
+        self.image.data = self.buffer_pool.get(
+            (focalplane.numamps_image, focalplane.numpix_amp)
+        )
+        self.new_roi = 0
+
+        return
+
+    def begin(self, exposure_time=-1, imagetype="", title=""):
+        """
+        Initiates the first part of an exposure, through image flushing.
+        Applies pending configurations, starts a new exposure timeline and
+        takes the next pool buffer, so the readout does not overwrite the
+        previous frame.
+        """
+
+        self.timeline.start()
+        with self.timeline.phase("begin"):
+            self.apply_config()
+            super().begin(exposure_time, imagetype, title)
+
+            focalplane = self.image.focalplane
+            self.image.data = self.buffer_pool.next(
+                (focalplane.numamps_image, focalplane.numpix_amp)
+            )
+
+        return
+
+    def apply_config(self, names=None):
+        """
+        Apply pending configurations of the config cache, only those in names
+        if given. Returns the list of configurations applied.
+        """
+
+        if self.config_cache is None:
+            return []
+
+        return self.config_cache.apply(names)
+
+    def flush(self, Cycles=1):
+        """
+        Flush/clear detector.
+        """
+
+        with self.timeline.phase("flush"):
+            return super().flush(Cycles)
+
+    def readout(self):
+        """
+        Exposure readout, publishing readout started and frame valid events.
+        """
+
+        self.timeline.end_phase("integrate")
+        self.frame_events.publish("readout")
+
+        try:
+            with self.timeline.phase("readout"):
+                super().readout()
+        finally:
+            if self.image.valid:
+                self.frame_events.publish(
+                    "valid", pixels=self.image.focalplane.numpix_image
+                )
+
+        return
+
+    def end(self):
+        """
+        Completes an exposure by writing file and displaying image.
+        Waits on the frame valid event rather than polling image.valid.
+        """
+
+        if not self.frame_events.wait("valid", self.valid_timeout):
+            azcam.log("ERROR image data not received in time")
+
+        if self.prefetch_headers:
+            with self.timeline.phase("headers"):
+                self.header_prefetch.merge()
+
+        # display here to record its time
+        display_image = self.display_image
+        self.display_image = 0
+        try:
+            super().end()
+        finally:
+            self.display_image = display_image
+
+        if self.image.is_written:
+            self.frame_events.publish("written", filename=self.last_filename)
+
+        if self.display_image and not self.write_async:
+            azcam.log("Displaying image")
+            with self.timeline.phase("display"):
+                azcam.db.tools["display"].display(self.image)
+
+        return
+
+    def update_headers(self):
+        """
+        Update all headers, reading current data.
+        With prefetch_headers set, tool headers are updated in the background
+        and merged in end(), only focalplane and system headers are updated here.
+        """
+
+        if not self.prefetch_headers:
+            return super().update_headers()
+
+        self.updating_header = 1
+
+        names = [
+            name
+            for name in azcam.db.headers
+            if name not in ["controller", "system", "exposure", "focalplane"]
+        ]
+        self.header_prefetch.start(names)
+
+        # update focalplane header which is not in db
+        self.image.focalplane.update_header()
+
+        # try to update system header last
+        if "system" in azcam.db.headers:
+            try:
+                azcam.db.headers["system"].update_header()
+            except Exception:
+                pass
+
+        self.updating_header = 0
+
+        return
+
+    def integrate(self):
+        """
+        Integration.
+        The countdown runs on a local monotonic deadline and wakes at once when
+        abort, pause, resume or readout is requested, instead of polling the
+        controller for the remaining time.
+        """
+
+        # start integration
+        self.timeline.start_phase("integrate")
+        self.exposure_flag = self.exposureflags["EXPOSING"]
+        imagetype = self.image_type.lower()
+        flags = self.exposureflags
+        controller = azcam.db.tools["controller"]
+
+        # start exposure
+        if imagetype != "zero":
+            azcam.log("Integration started")
+        self.flag_event.clear()
+        controller.start_exposure()
+        self.dark_time_start = time.time()
+        deadline = time.monotonic() + self.exposure_time
+        self.progress.start(self.exposure_time)
+        paused_start = 0.0
+        checked = 0
+
+        # wait for the deadline or an exposure_flag change
+        while True:
+            self.flag_event.clear()
+            flag = self.exposure_flag
+            remaining = deadline - time.monotonic()
+
+            if flag == flags["EXPOSING"]:
+                if remaining <= 0:
+                    if checked or self.exposure_time <= 0:
+                        break
+                    # one controller query at the deadline to cover any clock difference
+                    checked = 1
+                    remtime = self.get_exposuretime_remaining()
+                    if remtime <= 0:
+                        break
+                    deadline = time.monotonic() + min(remtime, self.exposure_time)
+                    continue
+                self.exposure_time_remaining = remaining
+                self.flag_event.wait(remaining)
+            elif flag == flags["ABORT"]:
+                if self.is_exposure_sequence:
+                    azcam.log("Stopping exposure sequence")
+                    self.is_exposure_sequence = 0
+                    self.exposure_sequence_number = 1
+                    self.exposure_flag = flags["EXPOSING"]
+                else:
+                    controller.exposure_abort()
+                    break
+            elif flag == flags["PAUSE"]:
+                controller.exposure_pause()
+                paused_start = time.monotonic()
+                self.exposure_flag = flags["PAUSED"]
+                azcam.log("Integration paused")
+            elif flag == flags["RESUME"]:
+                controller.exposure_resume()
+                if paused_start > 0:
+                    deadline += time.monotonic() - paused_start
+                    paused_start = 0.0
+                self.exposure_flag = flags["EXPOSING"]
+                azcam.log("Integration resumed")
+            elif flag == flags["READ"]:
+                self.exposure_time_actual = self.exposure_time - max(remaining, 0)
+                break
+            else:  # paused
+                self.flag_event.wait()
+
+        if self.exposure_flag == flags["ABORT"]:
+            azcam.log("Integration aborted")
+        else:
+            time.sleep(self.integration_guard)
+            self.exposure_flag = flags["READ"]  # set to readout
+
+        self.dark_time = time.time() - self.dark_time_start
+
+        # turn off comp lamps
+        if not self.comp_sequence:
+            if self.comp_exposure:
+                if not azcam.db.tools["instrument"].shutter_strobe:
+                    azcam.db.tools["instrument"].comps_off()
+                azcam.db.tools["instrument"].set_comps("shutter")
+
+        # extra close shutter command
+        controller.set_shutter(0)
+
+        # set times
+        self.exposure_time_remaining = 0
+        if imagetype == "zero":
+            self.exposure_time = self.exposure_time_saved
+
+        if self.exposure_flag == flags["ABORT"]:
+            azcam.exceptions.warning("Integration aborted")
+        else:
+            azcam.log("Integration finished", level=2)
+
+        self.timeline.end_phase("integrate")
+
+        return
+
+    # **************************************************************************
+    # guiding
+    # **************************************************************************
+
+    def guide(self, number_exposures=1):
+        """
+        Make a complete guider exposure sequence.
+        number_exposures is the number of exposures to make, -1 loop forever.
+        When guide_pipeline is set and frames go to ccdacq, each frame is read
+        into one of two buffers and sent by a worker thread while the next
+        frame flushes, integrates and reads out.
+        """
+
+        if not self._can_pipeline_guide():
+            return super().guide(number_exposures)
+
+        number_exposures = int(number_exposures)
+        flags = self.exposureflags
+        azcam.db.abortflag = 0
+
+        # system must be reset once before an exposure can be made
+        if not azcam.db.tools["controller"].is_reset:
+            azcam.db.tools["controller"].reset()
+
+        # a sender left from an earlier guide loop may still use a buffer
+        if not self._wait_guide_send(self.guide_timeout):
+            raise azcam.exceptions.AzcamError(
+                "previous guide frame is still being sent"
+            )
+
+        guidemode = self.guide_mode
+        self.guide_mode = 1
+        self.guide_frames = 0
+        self.guide_rate = 0.0
+        azcam.log("Guide started")
+
+        aborted = 0
+        attempts = 0  # frames started, ends the loop even if frames fail
+        t0 = time.monotonic()
+        try:
+            while True:
+                attempts += 1
+                self.begin(-1, "object", "guide image")
+
+                if self.exposure_flag != flags["ABORT"]:
+                    self.integrate()
+
+                if self.exposure_flag == flags["READ"]:
+                    buff = self._get_guide_buffer(self.guide_frames)
+                    self.image.data = buff
+                    try:
+                        self.readout()
+                        self.guide_status = 1  # image read OK
+                    except azcam.exceptions.AzcamError:
+                        self.guide_status = 2  # not read OK, don't stop guide loop
+
+                    if self.guide_status == 1:
+                        self._start_guide_send(
+                            buff[0], self.size_x, self.size_y, self.frame_events.frame
+                        )
+                        self.guide_frames += 1
+                        self.guide_rate = (
+                            60.0 * self.guide_frames / (time.monotonic() - t0)
+                        )
+
+                aborted = azcam.db.abortflag or self.exposure_flag == flags["ABORT"]
+                self.exposure_flag = flags["NONE"]
+                if aborted:
+                    break
+
+                if number_exposures != -1 and attempts >= number_exposures:
+                    break
+        finally:
+            self._wait_guide_send(self.guide_timeout)
+            if not self.flush_array:
+                azcam.db.tools["controller"].start_idle()
+            self.exposure_flag = flags["NONE"]
+            self.guide_status = 0
+            self.guide_mode = guidemode
+
+        if aborted:
+            azcam.exceptions.warning("Guide aborted")
+        else:
+            azcam.log(
+                f"Guide finished: {self.guide_frames} frames at {self.guide_rate:.1f} frames/min"
+            )
+
+        return
+
+    def _can_pipeline_guide(self):
+        """
+        Return True if guide frames can be sent from a buffer without writing a file.
+        """
+
+        if not self.guide_pipeline:
+            return False
+        if self.sendimage.remote_imageserver_type != "ccdacq":
+            return False
+        if self.image.focalplane.numamps_image != 1:
+            return False
+
+        return True
+
+    def _get_guide_buffer(self, frame_number):
+        """
+        Return one of the two preallocated guide image buffers.
+        Buffers are reallocated only when the image size changes.
+        """
+
+        shape = (
+            self.image.focalplane.numamps_image,
+            self.image.focalplane.numpix_amp,
+        )
+        if len(self._guide_buffers) != 2 or self._guide_buffers[0].shape != shape:
+            self._guide_buffers = [numpy.empty(shape, dtype="<u2") for _ in range(2)]
+
+        return self._guide_buffers[frame_number % 2]
+
+    def _start_guide_send(self, buff, size_x, size_y, frame):
+        """
+        Send a guide frame on a worker thread after the previous one is sent.
+        The buffer not being sent is the one read out next.
+        Raises AzcamError, stopping the guide loop, if the previous frame is
+        not sent within guide_timeout.
+        """
+
+        if not self._wait_guide_send(self.guide_timeout):
+            raise azcam.exceptions.AzcamError("guide frame not sent in time")
+
+        self._guide_thread = threading.Thread(
+            target=self._guide_send,
+            args=[buff, size_x, size_y, frame],
+            name="guidesend",
+            daemon=True,
+        )
+        self._guide_thread.start()
+
+        return
+
+    def _wait_guide_send(self, timeout=None):
+        """
+        Wait for the guide frame being sent.
+        Returns False if it is still being sent after timeout seconds,
+        the sender is kept so its buffer is not reused.
+        """
+
+        if self._guide_thread is None:
+            return True
+
+        self._guide_thread.join(timeout)
+        if self._guide_thread.is_alive():
+            azcam.log("ERROR guide frame not sent in time")
+            return False
+        self._guide_thread = None
+
+        return True
+
+    def _guide_send(self, buff, size_x, size_y, frame):
+        sendimage = self.sendimage
+        try:
+            sendimage_ccdacq.send_frame(
+                sendimage.remote_imageserver_host,
+                sendimage.remote_imageserver_port,
+                size_x,
+                size_y,
+                buff,
+                getattr(sendimage, "ccdacq_chunksize", sendimage_ccdacq.CHUNK_SIZE),
+                getattr(sendimage, "ccdacq_persistent", 1),
+            )
+            self.frame_events.publish("sent", frame=frame, destination="guide")
+        except Exception as e:
+            azcam.log(f"ERROR sending guide image: {e}")
+
+        return
+
+    def get_status(self):
+        """
+        Return a variety of system status data in one dictionary.
+        Adds timing of the last image transfer to the standard status.
+        """
+
+        response = super().get_status()
+
+        transfers = sendimage_ccdacq.transfers.get_transfers(1)
+        if transfers:
+            last = transfers[0]
+            response["sendtime"] = f"{last['total']:.3f}"
+            response["sendrate"] = f"{last['rate'] / 1.0e6:.1f}"
+        else:
+            response["sendtime"] = ""
+            response["sendrate"] = ""
+
+        response["guiderate"] = f"{self.guide_rate:.1f}"
+        response["framestate"] = self.frame_events.state
+        get_rows = getattr(self.receive_data, "get_rows", None)
+        response["rowsread"] = get_rows().shape[0] if get_rows is not None else ""
+        response["headertime"] = f"{self.image.header_time * 1000.0:.1f}"
+
+        return response
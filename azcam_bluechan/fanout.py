@@ -0,0 +1,120 @@
+"""
+Contains the FanOut class which delivers one frame to several image servers at once.
+"""
+
+import threading
+import time
+
+import numpy
+
+import azcam
+from azcam_bluechan import sendimage_ccdacq
+
+
+class FanOut(object):
+    """
+    Sends each frame to additional ccdacq-protocol destinations (such as an
+    archive or quicklook receiver) concurrently, one thread per destination.
+    All destinations share a single read-only copy of the frame.
+    A destination still busy with an earlier frame skips the new one, so a
+    slow consumer never queues up work or delays the main ccdacq delivery.
+    """
+
+    def __init__(self):
+        # {name: (host, port)}
+        self.destinations = {}
+        # {name: result dictionary of last frame}
+        self.results = {}
+
+        self.frame_number = 0
+        self._threads = {}
+        self._lock = threading.Lock()
+
+    def add_destination(self, name, host, port):
+        """
+        Add or replace a named destination.
+        """
+
+        with self._lock:
+            self.destinations[name] = (host, int(port))
+            self.results[name] = {"frame": 0, "state": "idle", "time": 0.0, "error": ""}
+
+        return
+
+    def remove_destination(self, name):
+        """
+        Remove a named destination.
+        """
+
+        with self._lock:
+            self.destinations.pop(name, None)
+            self.results.pop(name, None)
+
+        return
+
+    def send(self, size_x, size_y, buff, copy=True):
+        """
+        Start sending a frame to all destinations and return immediately.
+        buff is copied once unless copy is False, in which case the caller must
+        not modify it until all destinations are done.
+        """
+
+        with self._lock:
+            destinations = list(self.destinations.items())
+        if not destinations:
+            return
+
+        self.frame_number += 1
+
+        frame = numpy.array(buff, copy=True) if copy else buff.view()
+        frame.flags.writeable = False
+
+        for name, (host, port) in destinations:
+            thread = self._threads.get(name)
+            if thread is not None and thread.is_alive():
+                self.results[name] = {
+                    "frame": self.frame_number,
+                    "state": "skipped",
+                    "time": 0.0,
+                    "error": "destination busy",
+                }
+                continue
+
+            thread = threading.Thread(
+                target=self._send,
+                args=[name, host, port, size_x, size_y, frame, self.frame_number],
+                name=f"fanout_{name}",
+                daemon=True,
+            )
+            self._threads[name] = thread
+            thread.start()
+
+        return
+
+    def _send(self, name, host, port, size_x, size_y, frame, frame_number):
+        t0 = time.monotonic()
+        try:
+            sendimage_ccdacq.send_frame(host, port, size_x, size_y, frame)
+            result = {"state": "done", "error": ""}
+        except Exception as e:
+            result = {"state": "error", "error": str(e)}
+            azcam.log(f"ERROR sending frame to {name}: {e}")
+        result["frame"] = frame_number
+        result["time"] = time.monotonic() - t0
+
+        with self._lock:
+            if name in self.results:
+                self.results[name] = result
+
+        return
+
+    def get_status(self):
+        """
+        Return destinations and their last results.
+        """
+
+        with self._lock:
+            return {
+                name: {"destination": f"{host}:{port}", **self.results[name]}
+                for name, (host, port) in self.destinations.items()
+            }
@@ -0,0 +1,128 @@
+"""
+Contains write_fits_u2() which writes unsigned 16-bit frames to FITS through a memory map.
+
+Usage: python -m azcam_bluechan.fitswriter -benchmark 20
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+import numpy
+from astropy.io import fits
+
+# keywords set by write_fits_u2() and not copied from the header
+STRUCTURAL_KEYWORDS = {
+    "SIMPLE",
+    "BITPIX",
+    "NAXIS",
+    "NAXIS1",
+    "NAXIS2",
+    "EXTEND",
+    "BZERO",
+    "BSCALE",
+    "END",
+}
+
+BLOCK_SIZE = 2880
+
+
+def write_fits_u2(filename, data, header=None):
+    """
+    Write a 2-D '<u2' array as a single HDU FITS file.
+    header is an optional astropy Header whose non-structural cards are written.
+    The file is preallocated, the header block is written, and the data
+    section is memory mapped and filled in one vectorized pass with the
+    big-endian int16 values (BZERO=32768).
+    """
+
+    size_y, size_x = data.shape
+
+    cards = [
+        fits.Card("SIMPLE", True, "conforms to FITS standard"),
+        fits.Card("BITPIX", 16, "array data type"),
+        fits.Card("NAXIS", 2, "number of array dimensions"),
+        fits.Card("NAXIS1", size_x),
+        fits.Card("NAXIS2", size_y),
+        fits.Card("EXTEND", True),
+        fits.Card("BSCALE", 1),
+        fits.Card("BZERO", 32768),
+    ]
+    if header is not None:
+        cards.extend(
+            card for card in header.cards if card.keyword not in STRUCTURAL_KEYWORDS
+        )
+
+    text = "".join(card.image for card in cards) + "END".ljust(80)
+    header_bytes = (text + " " * (-len(text) % BLOCK_SIZE)).encode("ascii")
+    data_bytes = -(-data.size * 2 // BLOCK_SIZE) * BLOCK_SIZE
+
+    with open(filename, "wb") as f:
+        f.write(header_bytes)
+        f.truncate(len(header_bytes) + data_bytes)
+
+    # u2 - 32768 as int16 has the same bits as u2 with the sign bit flipped
+    mm = numpy.memmap(
+        filename, dtype=">u2", mode="r+", offset=len(header_bytes), shape=data.shape
+    )
+    numpy.bitwise_xor(data, 0x8000, out=mm)
+    del mm
+
+    return
+
+
+def benchmark(number_frames=10, size_x=2688, size_y=512, folder=None):
+    """
+    Write frames with astropy and with write_fits_u2() and
+    return (astropy seconds/frame, write_fits_u2 seconds/frame).
+    """
+
+    from azcam_bluechan.synthetic import SyntheticImage
+
+    data = SyntheticImage().make("flat", size_x, size_y, 20)
+    header = fits.Header()
+    for i in range(100):
+        header[f"KEY{i:03d}"] = (i * 1.5, f"keyword {i}")
+
+    folder = tempfile.mkdtemp() if folder is None else folder
+    astropy_file = os.path.join(folder, "astropy.fits")
+    fast_file = os.path.join(folder, "fast.fits")
+
+    t0 = time.perf_counter()
+    for _ in range(number_frames):
+        if os.path.exists(astropy_file):
+            os.remove(astropy_file)
+        hdu = fits.PrimaryHDU(data=data, header=header)
+        fits.HDUList([hdu]).writeto(astropy_file)
+    astropy_time = (time.perf_counter() - t0) / number_frames
+
+    t0 = time.perf_counter()
+    for _ in range(number_frames):
+        write_fits_u2(fast_file, data, header)
+    fast_time = (time.perf_counter() - t0) / number_frames
+
+    with fits.open(fast_file) as hdulist:
+        if not numpy.array_equal(hdulist[0].data, data):
+            raise RuntimeError("data read from fast FITS file does not match")
+
+    return astropy_time, fast_time
+
+
+def main():
+    args = sys.argv
+
+    number_frames = (
+        int(args[args.index("-benchmark") + 1]) if "-benchmark" in args else 10
+    )
+    folder = args[args.index("-folder") + 1] if "-folder" in args else None
+
+    astropy_time, fast_time = benchmark(number_frames, folder=folder)
+    print(f"astropy writer {astropy_time * 1000.0:.1f} ms/frame")
+    print(f"write_fits_u2 {fast_time * 1000.0:.1f} ms/frame")
+
+    return
+
+
+if __name__ == "__main__":
+    main()
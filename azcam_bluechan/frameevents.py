@@ -0,0 +1,128 @@
+"""
+Contains the FrameEvents class which publishes the lifecycle of each image frame.
+"""
+
+import threading
+import time
+
+import azcam
+import azcam.exceptions
+
+
+class FrameEvents(object):
+    """
+    Frame lifecycle event bus.
+    States are published as a frame moves through the system:
+      readout - readout started, a new frame number is assigned
+      rows - a block of pixels is available (pixels received so far)
+      valid - all image data received
+      written - image file written
+      sent - frame delivered to the remote image server
+    Consumers either block in wait() until a state is reached, waking as soon
+    as it is published, or subscribe() a callback. States of one frame are
+    independent, a consumer waits for the one it needs.
+    """
+
+    states = ("readout", "rows", "valid", "written", "sent")
+
+    def __init__(self):
+        # current frame number, incremented when readout starts
+        self.frame = 0
+        # last state published and its time
+        self.state = ""
+        self.state_time = 0.0
+        # {state: latest frame number which reached the state}
+        self.reached = {}
+        # {state: info dictionary of last publish}
+        self.info = {}
+
+        self._condition = threading.Condition()
+        self._subscribers = {}
+        self._subscriber_id = 0
+
+    def publish(self, state, frame=None, **info):
+        """
+        Publish state for frame (default current frame) and wake all waiters.
+        Publishing readout starts a new frame.
+        Returns the frame number.
+        """
+
+        if state not in self.states:
+            raise azcam.exceptions.AzcamError(f"Unknown frame state {state}")
+
+        with self._condition:
+            if state == "readout":
+                self.frame += 1
+            if frame is None:
+                frame = self.frame
+            self.reached[state] = max(frame, self.reached.get(state, 0))
+            self.state = state
+            self.state_time = time.time()
+            info["frame"] = frame
+            self.info[state] = info
+            self._condition.notify_all()
+            subscribers = list(self._subscribers.values())
+
+        for callback, states in subscribers:
+            if states is not None and state not in states:
+                continue
+            try:
+                callback(state, frame, info)
+            except Exception as e:
+                azcam.log(f"ERROR in frame event subscriber: {e}")
+
+        return frame
+
+    def wait(self, state, timeout=None, frame=None):
+        """
+        Wait until state is reached for frame (default current frame).
+        Returns True when reached, False if timeout seconds passed first.
+        """
+
+        if state not in self.states:
+            raise azcam.exceptions.AzcamError(f"Unknown frame state {state}")
+
+        with self._condition:
+            if frame is None:
+                frame = self.frame
+            return self._condition.wait_for(
+                lambda: self.reached.get(state, -1) >= frame, timeout
+            )
+
+    def subscribe(self, callback, states=None):
+        """
+        Call callback(state, frame, info) on each publish of states (default all).
+        Callbacks run in the publishing thread so must return quickly.
+        Returns an id for unsubscribe().
+        """
+
+        with self._condition:
+            self._subscriber_id += 1
+            self._subscribers[self._subscriber_id] = (
+                callback,
+                None if states is None else set(states),
+            )
+
+            return self._subscriber_id
+
+    def unsubscribe(self, subscriber_id):
+        """
+        Remove a subscriber.
+        """
+
+        with self._condition:
+            self._subscribers.pop(subscriber_id, None)
+
+        return
+
+    def get_status(self):
+        """
+        Return current frame number, last state and its age in seconds.
+        """
+
+        with self._condition:
+            return {
+                "frame": self.frame,
+                "state": self.state,
+                "age": time.time() - self.state_time if self.state else 0.0,
+            }
@@ -0,0 +1,165 @@
+"""
+Contains the HeaderCache class which keeps the FITS cards of each header source.
+"""
+
+import copy
+import time
+
+from astropy.io import fits
+
+import azcam
+
+
+class HeaderCache(object):
+    """
+    Cache of FITS cards for each header in azcam.db.headers.
+    A source's cards are rebuilt only when its keywords, values, comments,
+    types or title changed since the last image, and the combined cards of
+    all sources only when a source was rebuilt or the header order changed,
+    so header assembly for a frame costs a dictionary comparison per source
+    rather than building and formatting every card.
+    As in Image._write_PHU(), a keyword set again by a later source is moved
+    to the later position with the later value.
+    Shallow copies of the cached cards, with their formatted images, are
+    returned for each image, so changes made to an image header never alter
+    the cache.
+    """
+
+    def __init__(self):
+        # {headername: (values, comments, typestrings, title, cards)}
+        self.sources = {}
+
+        # cards of all sources in header order, their keywords and the order
+        self.cards = []
+        self.keywords = set()
+        self._order = []
+
+        # sources rebuilt and seconds spent for the last image
+        self.rebuilt = []
+        self.build_time = 0.0
+
+        self.builds = 0
+        self.total_time = 0.0
+
+    def get_cards(self):
+        """
+        Return a new list of cards for all headers in azcam.db.headerorder.
+        """
+
+        t0 = time.perf_counter()
+
+        rebuilt = []
+        for headername in azcam.db.headerorder:
+            header = azcam.db.headers[headername]
+            cached = self.sources.get(headername)
+            if cached is None or self._changed(header, cached):
+                self.sources[headername] = self._make_cards(header)
+                rebuilt.append(headername)
+
+        for headername in list(self.sources):
+            if headername not in azcam.db.headers:
+                del self.sources[headername]
+
+        order = list(azcam.db.headerorder)
+        if rebuilt or order != self._order:
+            self._combine(order)
+
+        cards = [copy.copy(card) for card in self.cards]
+
+        self.rebuilt = rebuilt
+        self.build_time = time.perf_counter() - t0
+        self.builds += 1
+        self.total_time += self.build_time
+
+        return cards
+
+    def clear(self):
+        """
+        Clear the cache so all sources are rebuilt for the next image.
+        """
+
+        self.sources = {}
+        self.cards = []
+        self.keywords = set()
+        self._order = []
+
+        return
+
+    def get_stats(self):
+        """
+        Return header assembly statistics.
+        """
+
+        return {
+            "sources": len(self.sources),
+            "cards": len(self.cards),
+            "rebuilt": self.rebuilt,
+            "build_time": self.build_time,
+            "builds": self.builds,
+            "mean_time": self.total_time / self.builds if self.builds else 0.0,
+        }
+
+    def _changed(self, header, cached):
+        return (
+            header.values != cached[0]
+            or header.comments != cached[1]
+            or header.typestrings != cached[2]
+            or header.title != cached[3]
+        )
+
+    def _combine(self, order):
+        """
+        Combine the cards of all sources in order, a repeated keyword
+        replacing the earlier card at the later position.
+        """
+
+        combined = {}
+        for i, headername in enumerate(order):
+            for j, card in enumerate(self.sources[headername][-1]):
+                keyword = card.keyword
+                if keyword in ("COMMENT", "HISTORY"):
+                    combined[(i, j)] = card
+                else:
+                    combined.pop(keyword, None)
+                    combined[keyword] = card
+
+        self.cards = list(combined.values())
+        self.keywords = {key for key in combined if isinstance(key, str)}
+        self._order = order
+
+        return
+
+    def _make_cards(self, header):
+        """
+        Make the cards for one header source, as written by Image._write_PHU().
+        """
+
+        cards = []
+        cheader = header.get_header()  # list of [kw, value, comment, type]
+        if cheader:
+            for comm in header.title:
+                card = fits.Card("COMMENT", header.title[comm])
+                card.image  # format now so copies share the image
+                cards.append(card)
+
+            for head in cheader:
+                keyword = head[0].lower()
+                try:
+                    if keyword == "comment":
+                        card = fits.Card("COMMENT", head[1])
+                    elif keyword == "history":
+                        card = fits.Card("HISTORY", head[1])
+                    else:
+                        card = fits.Card(head[0], head[1], head[2])
+                    card.image
+                    cards.append(card)
+                except Exception:
+                    pass  # bad values are skipped as in Image._write_PHU()
+
+        return (
+            dict(header.values),
+            dict(header.comments),
+            dict(header.typestrings),
+            dict(header.title),
+            cards,
+        )
@@ -0,0 +1,143 @@
+"""
+Contains the HeaderPrefetch class which updates slow header sources in the background.
+"""
+
+import threading
+import time
+
+import azcam
+
+
+class HeaderPrefetch(object):
+    """
+    Updates header sources (tempcon, instrument, telescope, ...) concurrently,
+    one thread per source, while the exposure integrates.
+    Each thread reads the source's current keyword values into a private
+    list, which merge() sets in azcam.db.headers only after the thread has
+    finished. The tool's header object is never replaced, so keywords set
+    by other threads meanwhile are kept.
+    merge() waits for the sources at most until timeout seconds after start().
+    A source not finished by then keeps its last good values, so a hung link
+    never delays an image. A source still busy from an earlier exposure is
+    not started again.
+    """
+
+    def __init__(self, timeout=2.0):
+        # seconds after start() by which all sources must be updated
+        self.timeout = timeout
+
+        # {name: thread} of last update of each source
+        self.threads = {}
+        # {name: [[keyword, value, comment, type], ...]} of last good update,
+        # None for a disabled source whose keywords are deleted
+        self.good = {}
+        # sources with a good update not yet set in azcam.db.headers
+        self.ready = set()
+        # {name: seconds taken by last good update}
+        self.times = {}
+        # sources which used last good values for the last merge
+        self.late = []
+
+        self.started = 0.0
+        self._lock = threading.Lock()
+
+    def start(self, names):
+        """
+        Start updating the named header sources and return immediately.
+        """
+
+        self.started = time.monotonic()
+
+        for name in names:
+            thread = self.threads.get(name)
+            if thread is not None and thread.is_alive():
+                continue
+
+            thread = threading.Thread(
+                target=self._update, args=[name], name=f"header_{name}", daemon=True
+            )
+            self.threads[name] = thread
+            thread.start()
+
+        return
+
+    def merge(self):
+        """
+        Wait for sources until the deadline, then set the updates of all
+        finished sources in azcam.db.headers. Sources not finished keep
+        their last good values.
+        Returns the list of late sources.
+        """
+
+        deadline = self.started + self.timeout
+
+        late = []
+        for name, thread in list(self.threads.items()):
+            thread.join(max(0.0, deadline - time.monotonic()))
+            if thread.is_alive():
+                late.append(name)
+
+        self._publish()
+
+        self.late = late
+        if late:
+            azcam.log(f"Header sources late, using last values: {' '.join(late)}")
+
+        return late
+
+    def get_stats(self):
+        """
+        Return update times of each source and the late sources.
+        """
+
+        with self._lock:
+            return {"times": dict(self.times), "late": self.late}
+
+    def _update(self, name):
+        """
+        Read the source's current keywords as ObjectHeaderMethods.update_header()
+        does, keeping the values read privately until merge().
+        """
+
+        tool = azcam.db.tools.get(name)
+        if tool is None:
+            return
+
+        t0 = time.monotonic()
+        try:
+            if not tool.is_enabled:
+                lines = None
+            else:
+                if not tool.is_initialized:
+                    tool.initialize()
+                tool.define_keywords()
+                lines = tool.read_header() or []
+        except Exception as e:
+            azcam.log(f"could not get {name} header: {e}")
+            return
+
+        with self._lock:
+            self.good[name] = lines
+            self.ready.add(name)
+            self.times[name] = time.monotonic() - t0
+
+        return
+
+    def _publish(self):
+        """
+        Set the good updates of finished sources in azcam.db.headers.
+        """
+
+        with self._lock:
+            ready = {name: self.good[name] for name in self.ready}
+            self.ready = set()
+
+        for name, lines in ready.items():
+            header = azcam.db.headers[name]
+            if lines is None:
+                header.delete_all_keywords()
+                continue
+            for keyword, value, comment, typestring in lines:
+                header.set_keyword(keyword, value, comment, typestring)
+
+        return
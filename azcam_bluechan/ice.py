@@ -3,6 +3,9 @@ Contains the ICE class for MMTO Blue Channel commands under ICE.
 """
 
 import azcam
+from azcam_bluechan.ccdacq import EXPOSE_PARAMETERS
+from azcam_bluechan.configcache import ConfigCache
+from azcam_bluechan.parameterstore import ParameterStore
 
 """
     reset
@@ -48,6 +51,9 @@ class ICE(object):
 
         self.status = "OK"
 
+        # parameters applied only when changed
+        self.parameter_store = ParameterStore()
+
         return
 
     def expose(self, flag, exposuretime, filename):
@@ -58,10 +64,7 @@ class ICE(object):
         filename is remote filename (do not use periods)
         """
 
-        azcam.db.parameters.set_par("imagetest", 0)
-        azcam.db.parameters.set_par("imageautoname", 0)
-        azcam.db.parameters.set_par("imageincludesequencenumber", 0)
-        azcam.db.parameters.set_par("imageautoincrementsequencenumber", 0)
+        self.parameter_store.set_pars(EXPOSE_PARAMETERS)
 
         azcam.db.tools["exposure"].set_filename(filename)
         azcam.db.tools["exposure"].expose(exposuretime, "object", "LBT Guider Image")
@@ -76,10 +79,7 @@ class ICE(object):
         filename is remote filename (do not use periods)
         """
 
-        azcam.db.parameters.set_par("imagetest", 0)
-        azcam.db.parameters.set_par("imageautoname", 0)
-        azcam.db.parameters.set_par("imageincludesequencenumber", 0)
-        azcam.db.parameters.set_par("imageautoincrementsequencenumber", 0)
+        self.parameter_store.set_pars(EXPOSE_PARAMETERS)
 
         azcam.db.tools["exposure"].set_filename(filename)
         azcam.db.tools["exposure"].expose1(exposuretime, "object", "LBT Guider Image")
@@ -113,6 +113,7 @@ class ICE(object):
         return self.status
 
     def getdetpars(self):
+        self._apply_geometry()
         nc = azcam.db.tools["focalplane"].numcols_image
         nr = azcam.db.tools["focalplane"].numrows_image
         return nc, nr
@@ -126,6 +127,7 @@ class ICE(object):
         elif attribute == "servername":
             reply = azcam.db.hostname
         elif attribute == "vispixels":
+            self._apply_geometry()
             nc = azcam.db.tools["focalplane"].numcols_image
             nr = azcam.db.tools["focalplane"].numrows_image
             reply = nc, nr
@@ -134,6 +136,17 @@ class ICE(object):
 
         return reply
 
+    def _apply_geometry(self):
+        """
+        Apply pending format and ROI changes so they are reported.
+        """
+
+        exposure = azcam.db.tools["exposure"]
+        if hasattr(exposure, "apply_config"):
+            exposure.apply_config(ConfigCache.geometry)
+
+        return
+
     def setexposure(self, exposure_time):
         azcam.db.tools["exposure"].set_exposuretime(exposure_time)
         return self.status
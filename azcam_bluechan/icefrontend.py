@@ -0,0 +1,245 @@
+"""
+Contains the IceFrontEnd class, an asyncio command server for ICE and azcam clients.
+"""
+
+import asyncio
+import concurrent.futures
+import os
+import threading
+
+import azcam
+from azcam_bluechan.MMTCommandParser import MMTCommandParser, format_reply
+
+
+class IceFrontEnd(object):
+    """
+    Asyncio socket front-end to the ccdacq tool, using the CommandServer
+    line protocol. One event loop serves all client connections.
+    Read-only ICE queries answered from local state (temperatures, progress,
+    transfer status, ...) are executed directly in the event loop, so any
+    number of status pollers are answered while an exposure command is
+    blocked in readout. The temperature sampler is primed before clients are
+    served, so these queries never read the controller.
+    Exposure control commands (abort, pause, resume, reset) run on their own
+    control thread so they act on an exposure command which is blocked in
+    integration or readout.
+    Other ICE commands are executed one at a time, in order, by a single
+    exposure executor thread.
+    Commands which are not ICE syntax, such as exposure.get_status from
+    AzCamTool, are passed to azcam.db.cmdserver in a thread pool, as the
+    CommandServer would run them.
+    """
+
+    # ccdacq get attributes whose values are kept locally
+    cached_attributes = {
+        "camtemp",
+        "dewtemp",
+        "temperatures",
+        "pixelcount",
+        "progress",
+        "rowsread",
+        "utc-obs",
+        "connections",
+        "sendstatus",
+        "transfers",
+        "destinations",
+        "bufferpool",
+        "headers",
+        "headerprefetch",
+        "timing",
+    }
+
+    # ccdacq commands answered from local state
+    cached_commands = {"readexposure"}
+
+    # ccdacq commands which control an exposure in progress
+    control_commands = {"abortexposure", "pauseexposure", "resumeexposure", "reset"}
+
+    def __init__(self, port=2402):
+        self.port = port
+        self.is_running = 0
+        self.log_connections = 1
+
+        # thread executing ICE commands which change state, one at a time
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="ice_executor"
+        )
+        # thread executing exposure control commands, not queued behind the executor
+        self.control = concurrent.futures.ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="ice_control"
+        )
+        # threads executing commands for azcam.db.cmdserver
+        self.pool = concurrent.futures.ThreadPoolExecutor(
+            max_workers=8, thread_name_prefix="ice_azcam"
+        )
+
+        self.parser = None
+        self.clients = 0
+        self.counts = {
+            "cached": 0,
+            "control": 0,
+            "executor": 0,
+            "azcam": 0,
+            "errors": 0,
+        }
+
+        self._loop = None
+
+    def start(self):
+        """
+        Start the front-end event loop in a thread.
+        """
+
+        self.parser = MMTCommandParser()
+
+        thread = threading.Thread(target=self.begin, name="icefrontend", daemon=True)
+        thread.start()
+
+        return
+
+    def begin(self):
+        """
+        Run the front-end event loop, waiting here forever.
+        """
+
+        try:
+            asyncio.run(self._serve())
+        except Exception as e:
+            self.is_running = 0
+            azcam.log(f"ERROR in icefrontend: {e!r} Is it already running? Exiting...")
+            os._exit(1)
+
+        return
+
+    def get_stats(self):
+        """
+        Return connected clients and counts of commands by where they ran.
+        """
+
+        return {"clients": self.clients, **self.counts}
+
+    async def _serve(self):
+        self._loop = asyncio.get_running_loop()
+        await self._loop.run_in_executor(self.pool, self._prime)
+        server = await asyncio.start_server(self._handle, "", self.port)
+        self.is_running = 1
+        async with server:
+            await server.serve_forever()
+
+    def _prime(self):
+        """
+        Take the first temperature sample, so cached queries do no I/O.
+        """
+
+        try:
+            azcam.db.tools["ccdacq"].temperature_sampler.get_temperatures()
+        except Exception as e:
+            azcam.log(f"icefrontend could not sample temperatures: {e}")
+
+        return
+
+    async def _handle(self, reader, writer):
+        self.clients += 1
+        client = writer.get_extra_info("peername")
+
+        try:
+            if self.log_connections:
+                azcam.log(f"icefrontend client connected from {client}", level=2)
+
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+
+                command = line.decode().strip()
+                lower = command.lower()
+
+                # disconnect on empty string
+                if command == "":
+                    writer.write(b"OK\r\n")
+                    break
+
+                if lower.startswith("closeconnection"):
+                    writer.write(b"OK\r\n")
+                    break
+                elif lower.startswith("exit"):
+                    writer.write(b"OK\r\n")
+                    await writer.drain()
+                    os._exit(0)
+                elif lower.startswith("register"):
+                    reply = "OK"
+                elif lower.startswith("echo"):
+                    reply = " ".join(["OK"] + command.split()[1:])
+                elif lower.startswith("updatemonitor"):
+                    reply = await self._loop.run_in_executor(
+                        self.pool, self._update_monitor
+                    )
+                else:
+                    reply = await self._command(command)
+
+                writer.write((reply + "\r\n").encode())
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.clients -= 1
+            writer.close()
+            if self.log_connections:
+                azcam.log(f"icefrontend client disconnected from {client}", level=2)
+
+        return
+
+    def _update_monitor(self):
+        """
+        Register with azcammonitor, as the CommandServer does.
+        """
+
+        try:
+            azcam.db.monitor.register()
+        except Exception as e:
+            self.counts["errors"] += 1
+            return f"ERROR {e!r}"
+
+        return "OK"
+
+    async def _command(self, command):
+        try:
+            parsed = self.parser.parse(command)
+        except Exception as e:
+            self.counts["errors"] += 1
+            return f"ERROR {e!r}"
+
+        if parsed is not None and self._is_cached(*parsed):
+            self.counts["cached"] += 1
+            return self._execute(parsed)
+
+        if parsed is not None and parsed[0].__name__ in self.control_commands:
+            self.counts["control"] += 1
+            executor = self.control
+        elif parsed is not None:
+            self.counts["executor"] += 1
+            executor = self.executor
+        else:
+            self.counts["azcam"] += 1
+            executor = self.pool
+
+        return await self._loop.run_in_executor(
+            executor, self._execute, parsed, command
+        )
+
+    def _is_cached(self, method, args):
+        name = method.__name__
+        if name == "get":
+            return len(args) > 0 and args[0] in self.cached_attributes
+
+        return name in self.cached_commands
+
+    def _execute(self, parsed, command=""):
+        try:
+            if parsed is None:
+                return azcam.db.cmdserver.command(command)
+            method, args = parsed
+            return format_reply(method(*args))
+        except Exception as e:
+            self.counts["errors"] += 1
+            return f"ERROR {e!r}"
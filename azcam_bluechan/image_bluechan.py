@@ -0,0 +1,131 @@
+"""
+Contains the ImageBlueChan class, the azcam image with cached header assembly.
+"""
+
+import os
+import time
+
+from astropy.io import fits
+from azcam.image import Image
+
+from azcam_bluechan.fitswriter import write_fits_u2
+from azcam_bluechan.headercache import HeaderCache
+
+
+class ImageBlueChan(Image):
+    """
+    Image whose primary header keywords from all header sources are taken
+    from a HeaderCache, rebuilding only sources which changed.
+    Single amplifier 16-bit FITS files are written with write_fits_u2().
+    """
+
+    def __init__(self, filename=""):
+        super().__init__(filename)
+
+        self.header_cache = HeaderCache()
+        # seconds to make the primary header of the last image written
+        self.header_time = 0.0
+        # exposure Timeline to record file writing, if set
+        self.timeline = None
+        # True to write single amplifier FITS files through a memory map
+        self.fast_fits = 1
+
+    def write_file(self, filename, filetype=-1):
+        """
+        Write image to disk file.
+        filetype is 0 for FITS, 1 for MEF, 2 for BIN, 6 for assembled.
+        """
+
+        t0 = time.monotonic()
+        super().write_file(filename, filetype)
+        if self.timeline is not None:
+            self.timeline.mark("write", t0, time.monotonic())
+
+        return
+
+    def _write_standardfits_file(self, filename):
+        """
+        Write a standard (non-MEF) FITS file.
+        """
+
+        if not (
+            self.fast_fits
+            and self.focalplane.numamps_image == 1
+            and self.save_data_format == 16
+            and not self.transposed_image
+            and not self.flip_image
+        ):
+            return super()._write_standardfits_file(filename)
+
+        # header cards as the standard writer makes them
+        hdu = fits.PrimaryHDU()
+        hdu.header.set("NAXIS", 2, "number of data axes")
+        self._write_PHU(hdu)
+        self.focalplane.update_header_keywords()
+        self.focalplane.update_ext_keywords()
+        self._write_extension_header(1, hdu)
+        self._write_wcs_keywords(1, hdu)
+
+        data = self.data[0].reshape(
+            self.focalplane.numrows_image, self.focalplane.numcols_image
+        )
+        write_fits_u2(filename, data, hdu.header)
+
+        return
+
+    def _write_PHU(self, hdu):
+        """
+        Write primary header for FITS or MEF file.
+        """
+
+        t0 = time.perf_counter()
+
+        numHDUs = self.focalplane.numamps_image
+        if numHDUs == 1:  # no extensions for single amp
+            numHDUs = 0
+        hdu.header.set("NEXTEND", numHDUs, "Number of extensions")
+        hdu.header.set("BITPIX", 16, "array data type")
+
+        # DETSIZE is whole mosaic size or CCD if single device (unbinned)
+        x = (
+            self.focalplane.ampvispix_x
+            * self.focalplane.num_ser_amps_det
+            * self.focalplane.numdet_x
+        )
+        y = (
+            self.focalplane.ampvispix_y
+            * self.focalplane.num_par_amps_det
+            * self.focalplane.numdet_y
+        )
+        hdu.header.set("DETSIZE", "[1:%d,1:%d]" % (x, y), "Detector size")
+
+        # CCDSUM is binning
+        s = "%d %d" % (self.focalplane.col_bin, self.focalplane.row_bin)
+        hdu.header.set("CCDSUM", s, "CCD pixel summing")
+        hdu.header.set(
+            "CCDBIN1", self.focalplane.col_bin, "Binning factor along axis 1"
+        )
+        hdu.header.set(
+            "CCDBIN2", self.focalplane.row_bin, "Binning factor along axis 2"
+        )
+
+        # filename at acquisition (no folder)
+        filename = os.path.basename(self.filename)
+        hdu.header.set("FILENAME", filename, "base filename at acquisition")
+
+        hdu.header.set("NCCDS", self.focalplane.num_detectors, "Number of CCDs")
+        hdu.header.set("NAMPS", self.focalplane.numamps_image, "Number of amplifiers")
+
+        # keywords from all header sources, a keyword set above is moved
+        # after them with the source value as by the standard writer
+        header = hdu.header
+        cards = self.header_cache.get_cards()
+        for keyword in [card.keyword for card in header.cards]:
+            if keyword in self.header_cache.keywords:
+                del header[keyword]
+        for card in cards:
+            header.append(card, end=True)
+
+        self.header_time = time.perf_counter() - t0
+
+        return
@@ -0,0 +1,84 @@
+"""
+Contains the ParameterStore class which applies only changed azcam parameters.
+"""
+
+import azcam
+import azcam.exceptions
+import azcam.utils
+
+
+class ParameterStore(object):
+    """
+    Applies groups of azcam parameters with set_par(), skipping parameters
+    whose current value is already the requested value.
+    Current values are read with get_par(), so values changed elsewhere
+    (such as exposure.test_image by startexposure) are seen.
+    A group is applied as one transaction, if any set_par() fails the
+    parameters already changed are restored.
+    """
+
+    def __init__(self):
+        # parameters written by the last set_pars()
+        self.changed = []
+
+        self.transactions = 0
+        self.writes = 0
+        self.skipped = 0
+
+    def set_pars(self, values, subdict=None):
+        """
+        Set the parameters in values {parameter: value} which differ from
+        their current values.
+        Returns the list of parameters written.
+        """
+
+        parameters = azcam.db.parameters
+
+        previous = {}
+        changes = {}
+        for parameter, value in values.items():
+            parameter = parameter.lower()
+            _, value = azcam.utils.get_datatype(value)
+            current = parameters.get_par(parameter, subdict)
+            if current == value:
+                self.skipped += 1
+                continue
+            previous[parameter] = current
+            changes[parameter] = value
+
+        self.transactions += 1
+        self.changed = list(changes)
+        if not changes:
+            return []
+
+        written = []
+        try:
+            for parameter, value in changes.items():
+                parameters.set_par(parameter, value, subdict)
+                written.append(parameter)
+        except Exception as e:
+            for parameter in written:
+                try:
+                    parameters.set_par(parameter, previous[parameter], subdict)
+                except Exception:
+                    pass
+            self.changed = []
+            raise azcam.exceptions.AzcamError(
+                f"could not set parameter {parameter}: {e}"
+            )
+
+        self.writes += len(written)
+
+        return written
+
+    def get_stats(self):
+        """
+        Return counts of parameter writes made and skipped.
+        """
+
+        return {
+            "transactions": self.transactions,
+            "writes": self.writes,
+            "skipped": self.skipped,
+            "changed": self.changed,
+        }
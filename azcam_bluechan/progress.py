@@ -0,0 +1,234 @@
+"""
+Contains the ExposureProgress class, a local model of integration and readout progress,
+and the ProgressPush class which sends that progress to clients.
+"""
+
+import socket
+import threading
+import time
+
+import azcam
+import azcam.exceptions
+
+
+class ExposureProgress(object):
+    """
+    Integration and readout progress kept locally, so progress queries cost
+    no controller I/O.
+    Integration time elapsed is taken from the monotonic clock since start(),
+    less any time paused. Pixels read are taken from the rows events
+    published by the receive thread, and from the valid event for readouts
+    which publish no rows.
+    """
+
+    def __init__(self, events):
+        # "idle", "integrating", "paused", "readout" or "done"
+        self.state = "idle"
+
+        self.exposure_time = 0.0
+        self.pixels = 0
+
+        self._start = 0.0
+        self._paused = 0.0
+        self._paused_total = 0.0
+        self._elapsed = 0.0
+        self._lock = threading.Lock()
+
+        events.subscribe(self._frame_event, ["readout", "rows", "valid"])
+
+    def start(self, exposure_time):
+        """
+        Start integration progress for an exposure of exposure_time seconds.
+        """
+
+        with self._lock:
+            self.state = "integrating"
+            self.exposure_time = float(exposure_time)
+            self.pixels = 0
+            self._start = time.monotonic()
+            self._paused = 0.0
+            self._paused_total = 0.0
+            self._elapsed = 0.0
+
+        return
+
+    def pause(self):
+        """
+        Stop the integration clock.
+        """
+
+        with self._lock:
+            if self.state == "integrating":
+                self.state = "paused"
+                self._paused = time.monotonic()
+
+        return
+
+    def resume(self):
+        """
+        Restart the integration clock.
+        """
+
+        with self._lock:
+            if self.state == "paused":
+                self.state = "integrating"
+                self._paused_total += time.monotonic() - self._paused
+
+        return
+
+    def stop(self):
+        """
+        Stop progress of an aborted exposure.
+        """
+
+        with self._lock:
+            if self.state in ["integrating", "paused"]:
+                self._elapsed = self._get_elapsed()
+            self.state = "idle"
+
+        return
+
+    def get_elapsed(self):
+        """
+        Return integration time elapsed in seconds.
+        """
+
+        with self._lock:
+            return self._get_elapsed()
+
+    def get_pixels(self):
+        """
+        Return number of pixels read so far for the current frame.
+        """
+
+        return self.pixels
+
+    def get_status(self):
+        """
+        Return state, integration time elapsed and pixels read.
+        """
+
+        with self._lock:
+            return {
+                "state": self.state,
+                "elapsed": self._get_elapsed(),
+                "exposure_time": self.exposure_time,
+                "pixels": self.pixels,
+            }
+
+    def _get_elapsed(self):
+        if self.state == "integrating":
+            elapsed = time.monotonic() - self._start - self._paused_total
+        elif self.state == "paused":
+            elapsed = self._paused - self._start - self._paused_total
+        else:
+            return self._elapsed
+
+        return min(max(elapsed, 0.0), self.exposure_time)
+
+    def _frame_event(self, state, frame, info):
+        with self._lock:
+            if state == "readout":
+                if self.state in ["integrating", "paused"]:
+                    self._elapsed = self._get_elapsed()
+                self.state = "readout"
+                self.pixels = 0
+            elif state == "rows":
+                self.pixels = info.get("pixels", self.pixels)
+            elif state == "valid":
+                self.state = "done"
+                self.pixels = info.get("pixels", self.pixels)
+
+        return
+
+
+class ProgressPush(object):
+    """
+    Sends exposure progress to client sockets at a fixed rate, so clients
+    need not poll readexposure and pixelcount.
+    Each update is one line: "<elapsed msec> <pixels read> <state>\\r\\n".
+    A client which stops accepting updates is dropped.
+    """
+
+    def __init__(self, progress):
+        self.progress = progress
+
+        # {"host:port": thread}
+        self.clients = {}
+        self._stops = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, host, port, rate=2.0):
+        """
+        Connect to host:port and send progress rate times per second.
+        """
+
+        rate = float(rate)
+        if rate <= 0:
+            raise azcam.exceptions.AzcamError(f"invalid progress rate {rate}")
+
+        name = f"{host}:{port}"
+        self.unsubscribe(host, port)
+
+        try:
+            sock = socket.create_connection((host, int(port)), timeout=5.0)
+        except OSError as e:
+            raise azcam.exceptions.AzcamError(f"could not connect to {name}: {e}")
+
+        stop = threading.Event()
+        thread = threading.Thread(
+            target=self._worker,
+            args=[name, sock, 1.0 / rate, stop],
+            name=f"progress_{name}",
+            daemon=True,
+        )
+        with self._lock:
+            self.clients[name] = thread
+            self._stops[name] = stop
+        thread.start()
+
+        return
+
+    def unsubscribe(self, host, port):
+        """
+        Stop sending progress to host:port.
+        """
+
+        name = f"{host}:{port}"
+        with self._lock:
+            stop = self._stops.pop(name, None)
+            self.clients.pop(name, None)
+        if stop is not None:
+            stop.set()
+
+        return
+
+    def get_clients(self):
+        """
+        Return the names of subscribed clients.
+        """
+
+        with self._lock:
+            return list(self.clients)
+
+    def _worker(self, name, sock, period, stop):
+        try:
+            while not stop.is_set():
+                status = self.progress.get_status()
+                line = "%d %d %s\r\n" % (
+                    int(status["elapsed"] * 1000),
+                    status["pixels"],
+                    status["state"],
+                )
+                sock.sendall(line.encode())
+                stop.wait(period)
+        except OSError as e:
+            azcam.log(f"progress client {name} dropped: {e}")
+        finally:
+            sock.close()
+            with self._lock:
+                if self._stops.get(name) is stop:
+                    self._stops.pop(name)
+                    self.clients.pop(name)
+
+        return
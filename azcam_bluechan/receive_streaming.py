@@ -0,0 +1,429 @@
+"""
+Contains the ReceiveDataStreaming class which forwards pixels to ccdacq during readout.
+"""
+
+import queue
+import socket
+import threading
+import time
+
+import numpy
+
+import azcam
+import azcam.exceptions
+from azcam.tools.arc.receive_data import ReceiveData
+
+from azcam_bluechan import sendimage_ccdacq
+from azcam_bluechan.synthetic import SyntheticImage
+
+
+class ReceiveDataStreaming(ReceiveData):
+    """
+    ReceiveData which forwards each block of pixels to a ccdacq image server
+    as soon as it arrives from the controller server.
+    Blocks are handed to a sender thread through a bounded queue, so a slow
+    ccdacq never slows receiving from the controller, the stream is dropped
+    instead when the queue is full.
+    Data which needs no deinterlacing (single amplifier, default data order)
+    is received directly into the image buffer, so the rows already received
+    can be viewed during readout. Streaming is used only for such data and
+    when a destination is set. Otherwise, or if the stream fails, the frame
+    is received normally and must be sent afterwards.
+    """
+
+    def __init__(self, exposure):
+        super().__init__(exposure)
+
+        # streaming destination, no streaming if host is ""
+        self.stream_host = ""
+        self.stream_port = 0
+
+        # True when the last frame was delivered completely by streaming
+        self.streamed = 0
+        # bytes forwarded for the current frame
+        self.stream_bytes = 0
+        # True when the current frame is received directly into the image buffer
+        self.direct = 0
+        # blocks waiting to be streamed, the stream is dropped when more arrive
+        self.stream_queue_size = 8
+
+        self._connection = None
+        self._socket = None
+        self._blocks = None
+        self._sender = None
+        self._stream_error = ""
+        self._times = [0.0, 0.0, 0.0]  # start, connect, header
+
+        # demo mode frames: ramp, bias, flat or cosmic
+        self.synthetic = SyntheticImage()
+        self.demo_imagetype = "ramp"
+
+    def set_stream(self, host="", port=0):
+        """
+        Set the ccdacq destination for streamed readouts.
+        An empty host disables streaming.
+        """
+
+        self.stream_host = host
+        self.stream_port = int(port)
+
+        return
+
+    def can_receive_direct(self):
+        """
+        Return True if the next readout may be received directly into the image buffer.
+        """
+
+        if azcam.db.tools["controller"].camserver.demo_mode:
+            return False
+        if self.exposure.image.focalplane.numamps_image != 1:
+            return False
+        if len(self.exposure.data_order) != 0:
+            return False
+
+        return True
+
+    def can_stream(self):
+        """
+        Return True if the next readout may be streamed.
+        """
+
+        if self.stream_host == "":
+            return False
+
+        return self.can_receive_direct()
+
+    def receive_image_data(self, data_size):
+        """
+        Receive binary image data from controller server, streaming it
+        to ccdacq when possible.
+        data_size is bytes.
+        """
+
+        self.streamed = 0
+        self.stream_bytes = 0
+
+        timeline = getattr(self.exposure, "timeline", None)
+        if timeline is None:
+            return self._receive_image_data(data_size)
+
+        with timeline.phase("receive"):
+            return self._receive_image_data(data_size)
+
+    def _receive_image_data(self, data_size):
+        self.direct = self.can_receive_direct()
+        if not self.direct:
+            return super().receive_image_data(data_size)
+
+        if not self.can_stream():
+            return self._receive_direct(data_size)
+
+        self._start_stream()
+        try:
+            self._receive_direct(data_size)
+        except Exception:
+            self._stop_stream(error=True)
+            raise
+
+        self._end_sender()
+        if (
+            self._socket is not None
+            and not self._stream_error
+            and self.stream_bytes == data_size
+        ):
+            self.streamed = self._finish_stream(time.monotonic())
+        else:
+            self._stop_stream(error=True)
+
+        return
+
+    def request_data(self, datacnt):
+        """
+        Request a block of data from the controller server and queue it for
+        the sender thread.
+        """
+
+        data = super().request_data(datacnt)
+
+        if self._sender is not None and len(data) > 0:
+            if not self._stream_error:
+                try:
+                    self._blocks.put_nowait(data)
+                except queue.Full:
+                    self._stream_error = "ccdacq not keeping up with readout"
+            if self._stream_error:
+                azcam.log(f"ccdacq stream stopped: {self._stream_error}")
+                self._stop_stream(error=True)
+
+        return data
+
+    def _stream_sender(self, sock, blocks):
+        """
+        Send queued blocks to ccdacq until None is queued (runs as a thread).
+        After an error the remaining blocks are discarded.
+        """
+
+        while True:
+            data = blocks.get()
+            if data is None:
+                break
+            if self._stream_error:
+                continue
+            try:
+                self.stream_bytes += sendimage_ccdacq.send_buffer(sock, data)
+            except Exception as e:
+                self._stream_error = str(e)
+
+        return
+
+    def _receive_direct(self, data_size):
+        """
+        Receive single amplifier image data from controller server directly
+        into exposure.image.data[0], as receive_image_data() does through a
+        temporary buffer. PixelsReadout counts the pixels already stored.
+        """
+
+        exposure = self.exposure
+        controller = azcam.db.tools["controller"]
+        events = getattr(exposure, "frame_events", None)
+
+        # create a new socket for binary data and connect to the controller server
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.connect((controller.camserver.host, controller.camserver.port))
+
+        azcam.log(f"Receiving image data: {data_size} bytes", level=3)
+
+        self.numamps_image = 1
+        self.numpix_amp = exposure.image.focalplane.numpix_amp
+        image = exposure.image.data[0]
+
+        reqCnt = min(data_size - 17, self.RecBufferSize - 17)
+        dataCnt = 0  # received data counter
+        repCnt = 0  # repeat data request counter
+        self.PixelsReadout = 0
+        self.pixels_remaining = int(data_size / 2)
+
+        while (dataCnt < data_size) and (repCnt < 50):
+            # check if aborted by user, in a sequence let this readout finish
+            if (
+                exposure.exposure_flag == exposure.exposureflags["ABORT"]
+                and not exposure.is_exposure_sequence
+            ):
+                controller.readout_abort()  # stop ControllerServer
+                break
+
+            data = self.request_data(reqCnt + 17)
+            len1 = len(data)
+            azcam.log(f"Readout: {self.pixels_remaining:10d} pixels remaining", level=3)
+
+            if len1 != 0:
+                dataCnt += len1
+                repCnt = 0
+
+                pixels = len1 // 2
+                ptr = self.PixelsReadout
+                image[ptr : ptr + pixels] = numpy.frombuffer(
+                    data, dtype="<u2", count=pixels
+                )
+
+                reqCnt = min(data_size - dataCnt - 17, self.RecBufferSize - 17)
+                self.PixelsReadout = ptr + pixels
+                self.pixels_remaining -= pixels
+
+                if events is not None:
+                    events.publish("rows", pixels=self.PixelsReadout)
+            else:
+                time.sleep(0.2)
+                repCnt += 1
+
+        self.socket.close()
+
+        # check if all data has been received
+        if dataCnt == data_size:
+            self.is_valid = 1
+            self.pixels_remaining = 0
+            azcam.log("Image data received")
+        elif exposure.exposure_flag != exposure.exposureflags["ABORT"]:
+            raise azcam.exceptions.AzcamError(
+                "ERROR in ReceiveImageData: Received %d of %d bytes"
+                % (dataCnt, data_size)
+            )
+        else:
+            raise azcam.exceptions.AzcamError(
+                "Aborted in receive_image_data", error_code=3
+            )
+
+        return
+
+    def get_rows(self):
+        """
+        Return a read-only view of the image rows received so far, shape
+        (rows, columns). Rows are available during readout only when the
+        frame is received directly, otherwise once the image is valid.
+        """
+
+        focalplane = self.exposure.image.focalplane
+        numcols = focalplane.numcols_image
+
+        if self.direct:
+            rows = min(self.PixelsReadout // numcols, focalplane.numrows_image)
+        elif self.exposure.image.valid and focalplane.numamps_image == 1:
+            rows = focalplane.numrows_image
+        else:
+            rows = 0
+
+        if rows == 0:
+            return numpy.empty((0, numcols), dtype="<u2")
+
+        view = self.exposure.image.data[0][: rows * numcols].reshape(rows, numcols)
+        view.flags.writeable = False
+
+        return view
+
+    def get_preview(self, size_x=64, size_y=32):
+        """
+        Return a coarse preview of the rows received so far, binned to at most
+        size_x by size_y of the full image.
+        """
+
+        focalplane = self.exposure.image.focalplane
+        rows = self.get_rows()
+
+        bin_x = max(1, focalplane.numcols_image // size_x)
+        bin_y = max(1, focalplane.numrows_image // size_y)
+        ny = rows.shape[0] // bin_y
+        nx = rows.shape[1] // bin_x
+
+        return (
+            rows[: ny * bin_y, : nx * bin_x]
+            .reshape(ny, bin_y, nx, bin_x)
+            .mean(axis=(1, 3))
+        )
+
+    def mock_data(self):
+        """
+        Generate synthetic data for demo mode directly into the image buffer.
+        """
+
+        focalplane = self.exposure.image.focalplane
+        data = self.exposure.image.data
+        numamps = focalplane.numamps_image
+
+        if numamps == 1:
+            self.synthetic.make_focalplane(self.demo_imagetype, focalplane, data[0])
+        else:
+            frame = self.synthetic.make_focalplane(self.demo_imagetype, focalplane)
+            data[:] = frame.reshape(numamps, -1)
+
+        events = getattr(self.exposure, "frame_events", None)
+        if events is not None:
+            events.publish("rows", pixels=focalplane.numpix_image)
+
+        return
+
+    def _start_stream(self):
+        """
+        Open the ccdacq connection and send the frame header.
+        """
+
+        connection = sendimage_ccdacq.connections.get(
+            self.stream_host, self.stream_port
+        )
+        connection.lock.acquire()
+        self._connection = connection
+
+        try:
+            t0 = time.monotonic()
+            self._socket = connection.acquire()
+            t_connect = time.monotonic()
+            s1 = "%d %d\r\n" % (self.exposure.size_x, self.exposure.size_y)
+            self._socket.sendall(str.encode(s1))
+            s1 = "NoFilename NoImageType\r\n"
+            self._socket.sendall(str.encode(s1))
+            self._times = [t0, t_connect, time.monotonic()]
+        except Exception as e:
+            azcam.log(f"ccdacq stream not started: {e}")
+            self._stop_stream(error=True)
+            return
+
+        self._stream_error = ""
+        self._blocks = queue.Queue(self.stream_queue_size)
+        self._sender = threading.Thread(
+            target=self._stream_sender,
+            args=[self._socket, self._blocks],
+            name="ccdacq_stream",
+            daemon=True,
+        )
+        self._sender.start()
+
+        return
+
+    def _end_sender(self, error=False):
+        """
+        Wait for the sender thread to send the queued blocks and exit.
+        After an error the socket is shut down so a blocked send returns.
+        """
+
+        if self._sender is None:
+            return
+
+        if error:
+            if not self._stream_error:
+                self._stream_error = "stream stopped"
+            try:
+                self._socket.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+        self._blocks.put(None)
+        self._sender.join()
+        self._sender = None
+        self._blocks = None
+
+        return
+
+    def _finish_stream(self, t_payload):
+        """
+        Wait for the ccdacq acknowledgement and release the connection.
+        The payload phase of a streamed transfer spans the whole readout.
+        Returns True if the frame was delivered.
+        """
+
+        try:
+            acknowledged = sendimage_ccdacq.receive_ack(self._connection, self._socket)
+        except azcam.exceptions.AzcamError as e:
+            azcam.log(f"ccdacq stream failed: {e}")
+            self._stop_stream()  # already discarded
+            return False
+        t_ack = time.monotonic()
+
+        destination = f"{self._connection.host}:{self._connection.port}"
+        sendimage_ccdacq.transfers.add(
+            destination, *self._times, t_payload, t_ack, self.stream_bytes
+        )
+
+        self._connection.frames += 1
+        if not acknowledged:
+            self._connection.close()
+        self._stop_stream()
+
+        azcam.log(f"Streamed {self.stream_bytes} bytes to ccdacq", level=2)
+
+        return True
+
+    def _stop_stream(self, error=False):
+        """
+        Release the connection, closing it after an error.
+        """
+
+        if self._connection is None:
+            return
+
+        self._end_sender(error)
+        if error:
+            self._connection.discard()
+        self._socket = None
+        self._connection.lock.release()
+        self._connection = None
+
+        return
@@ -1,50 +1,158 @@
-import socket
+import time
 
 import azcam
 import azcam.exceptions
+from azcam_bluechan.connections import ConnectionPool
+from azcam_bluechan.transferlog import TransferLog
 
+# default number of bytes handed to each socket send call
+CHUNK_SIZE = 256 * 1024
 
-def sendimage_ccdacq(self, localfile, remotefile=None):
+# acknowledgement byte sent by ccdacq after each frame
+ACK = b"1"
+
+# seconds to wait for the acknowledgement
+ACK_TIMEOUT = 10.0
+
+# persistent connections to ccdacq image servers, shared by all senders
+connections = ConnectionPool()
+
+# phase timings of recent transfers
+transfers = TransferLog()
+
+
+def send_buffer(sock, buff, chunksize=CHUNK_SIZE):
     """
-    Send raw image data to cccdacq (ICE) application.
+    Send an entire buffer on a socket, resending partial writes.
+    buff is any object supporting the buffer protocol (e.g. a numpy array).
+    The buffer is walked with a memoryview so no intermediate copies are made.
+    Returns the number of bytes sent.
     """
 
-    # open socket to remote image server
-    ccdacqsocket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    ccdacqsocket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 0)
+    view = memoryview(buff).cast("B")
+    numbytes = view.nbytes
+    chunksize = int(chunksize)
+
+    numsent = 0
+    while numsent < numbytes:
+        sent = sock.send(view[numsent : numsent + chunksize])
+        if sent == 0:
+            raise azcam.exceptions.AzcamError(
+                f"ccdacq image server connection broken after {numsent} of {numbytes} bytes"
+            )
+        numsent += sent
+
+    view.release()
+
+    return numsent
+
+
+def receive_ack(connection, sock, timeout=None):
+    """
+    Wait for the ccdacq acknowledgement of a frame.
+    Returns True if acknowledged, False if ccdacq closed its end after
+    reading the frame. On timeout, error or an unexpected reply the
+    connection is discarded and AzcamError raised.
+    timeout is seconds to wait, default ACK_TIMEOUT.
+    """
 
     try:
-        ccdacqsocket.connect(
-            (self.remote_imageserver_host, self.remote_imageserver_port)
+        sock.settimeout(ACK_TIMEOUT if timeout is None else timeout)
+        reply = sock.recv(1)
+        sock.settimeout(None)
+    except OSError as e:
+        connection.discard()
+        raise azcam.exceptions.AzcamError(
+            f"no acknowledgement from ccdacq server: {e or 'timeout'}"
         )
-    except Exception as message:
-        ccdacqsocket.close()
-        raise azcam.exceptions.AzcamError(f"ccdacq image server not opened: {message}")
-
-    # send header
-    s1 = "%d %d\r\n" % (self.size_x, self.size_y)
-    if ccdacqsocket.send(str.encode(s1)) != len(s1):
-        raise azcam.exceptions.AzcamError(f"socket send error header1")
-
-    s1 = "NoFilename NoImageType\r\n"
-    if ccdacqsocket.send(str.encode(s1)) != len(s1):
-        raise azcam.exceptions.AzcamError(f"socket send error header2")
-
-    # send file data
-    buff = azcam.db.tools["exposure"].image.data[0]
-    numsent = ccdacqsocket.send(buff)
-    if numsent != 2 * len(buff):
+
+    if len(reply) == 0:
+        return False
+
+    if reply != ACK:
+        connection.discard()
         raise azcam.exceptions.AzcamError(
-            f"Could not send all image data to ccdacq server"
+            f"bad acknowledgement from ccdacq server: {reply!r}"
         )
 
-    # wait before closing
-    try:
-        reply = ccdacqsocket.recv(1)
-    except Exception as e:
-        pass
+    return True
+
+
+def send_frame(host, port, size_x, size_y, buff, chunksize=CHUNK_SIZE, persistent=1):
+    """
+    Send one frame to a ccdacq image server using the ccdacq protocol.
+    buff is the raw u2 pixel buffer.
+    Returns (bytes sent, seconds spent sending pixel data).
+    """
+
+    connection = connections.get(host, port)
+
+    with connection.lock:
+        t0 = time.monotonic()
+        ccdacqsocket = connection.acquire()
+        t_connect = time.monotonic()
+
+        try:
+            # send header
+            s1 = "%d %d\r\n" % (size_x, size_y)
+            ccdacqsocket.sendall(str.encode(s1))
+
+            s1 = "NoFilename NoImageType\r\n"
+            ccdacqsocket.sendall(str.encode(s1))
+            t_header = time.monotonic()
+
+            # send image data
+            numsent = send_buffer(ccdacqsocket, buff, chunksize)
+            t_payload = time.monotonic()
+        except (OSError, azcam.exceptions.AzcamError) as message:
+            connection.discard()
+            raise azcam.exceptions.AzcamError(
+                f"Could not send all image data to ccdacq server: {message}"
+            )
+
+        # wait for acknowledgement
+        acknowledged = receive_ack(connection, ccdacqsocket)
+        t_ack = time.monotonic()
+
+        connection.frames += 1
+
+        # no acknowledgement means ccdacq closed its end
+        if not persistent or not acknowledged:
+            connection.close()
+
+    destination = f"{connection.host}:{connection.port}"
+    transfers.add(destination, t0, t_connect, t_header, t_payload, t_ack, numsent)
+
+    return numsent, t_payload - t_header
+
+
+def sendimage_ccdacq(self, localfile, remotefile=None, data=None):
+    """
+    Send raw image data to cccdacq (ICE) application.
+    data is the pixel buffer to send, default is the current exposure image.
+    The connection is kept open for the next frame unless
+    self.ccdacq_persistent is false.
+    """
+
+    if data is None:
+        data = azcam.db.tools["exposure"].image.data[0]
+    chunksize = getattr(self, "ccdacq_chunksize", CHUNK_SIZE)
+    persistent = getattr(self, "ccdacq_persistent", 1)
+
+    numsent, dt = send_frame(
+        self.remote_imageserver_host,
+        self.remote_imageserver_port,
+        self.size_x,
+        self.size_y,
+        data,
+        chunksize,
+        persistent,
+    )
 
-    # close socket
-    ccdacqsocket.close()
+    rate = numsent / dt if dt > 0 else 0.0
+    azcam.log(
+        f"Sent {numsent} bytes to ccdacq in {dt:.3f} sec ({rate / 1.0e6:.1f} MB/sec)",
+        level=2,
+    )
 
     return
@@ -0,0 +1,156 @@
+"""
+Contains the SendQueue class which sends frames to ccdacq in the background.
+"""
+
+import queue
+import threading
+import time
+
+import azcam
+import azcam.exceptions
+from azcam_bluechan import sendimage_ccdacq
+
+
+class SendQueue(object):
+    """
+    Bounded queue of frames waiting to be sent to a ccdacq image server.
+    A single worker thread sends the frames in order.
+    """
+
+    def __init__(self, maxsize=2):
+        self.maxsize = maxsize
+        self.queue = queue.Queue(maxsize)
+
+        self.chunksize = sendimage_ccdacq.CHUNK_SIZE
+        self.persistent = 1
+
+        self.frame_number = 0
+        self.inflight = None  # record of frame being sent
+        self.last = None  # record of last frame finished
+        self.sent = 0
+        self.errors = 0
+
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def is_full(self):
+        """
+        Return True if no more frames can be queued.
+        """
+
+        return self.queue.full()
+
+    def submit(self, host, port, size_x, size_y, buff, callback=None):
+        """
+        Queue a frame for sending and return immediately.
+        buff must not be modified until the frame has been sent.
+        callback(record) is called from the worker after a successful send.
+        Raises AzcamError if the queue is full.
+        """
+
+        with self._lock:
+            record = {
+                "frame": self.frame_number + 1,
+                "state": "queued",
+                "destination": f"{host}:{port}",
+                "bytes": 0,
+                "queued": time.monotonic(),
+                "wait_time": 0.0,
+                "send_time": 0.0,
+                "error": "",
+            }
+
+            try:
+                self.queue.put_nowait(
+                    (record, host, int(port), size_x, size_y, buff, callback)
+                )
+            except queue.Full:
+                raise azcam.exceptions.AzcamError("ccdacq send queue is full")
+            self.frame_number += 1
+
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._worker, name="ccdacq_sendqueue", daemon=True
+                )
+                self._thread.start()
+
+        return record["frame"]
+
+    def wait(self, timeout=None):
+        """
+        Wait until all queued frames have been sent.
+        Returns True if the queue drained before timeout.
+        """
+
+        end = None if timeout is None else time.monotonic() + timeout
+        while self.queue.unfinished_tasks:
+            if end is not None and time.monotonic() > end:
+                return False
+            time.sleep(0.01)
+
+        return True
+
+    def _worker(self):
+        """
+        Send queued frames in order (runs as a daemon thread).
+        """
+
+        while True:
+            record, host, port, size_x, size_y, buff, callback = self.queue.get()
+
+            t0 = time.monotonic()
+            record["wait_time"] = t0 - record["queued"]
+            record["state"] = "inflight"
+            self.inflight = record
+
+            try:
+                numsent, _ = sendimage_ccdacq.send_frame(
+                    host, port, size_x, size_y, buff, self.chunksize, self.persistent
+                )
+                record["bytes"] = numsent
+                record["state"] = "done"
+                self.sent += 1
+            except Exception as e:
+                record["state"] = "error"
+                record["error"] = str(e)
+                self.errors += 1
+                azcam.log(f"ERROR sending frame {record['frame']} to ccdacq: {e}")
+
+            record["send_time"] = time.monotonic() - t0
+            self.inflight = None
+            self.last = record
+
+            if callback is not None and record["state"] == "done":
+                try:
+                    callback(record)
+                except Exception as e:
+                    azcam.log(f"ERROR in send queue callback: {e}")
+
+            self.queue.task_done()
+
+    def get_status(self):
+        """
+        Return a dictionary describing queued, in-flight and last sent frames.
+        """
+
+        status = {
+            "queued": self.queue.qsize(),
+            "maxsize": self.maxsize,
+            "sent": self.sent,
+            "errors": self.errors,
+            "inflight": None,
+            "last": None,
+        }
+
+        inflight = self.inflight
+        if inflight is not None:
+            status["inflight"] = {
+                "frame": inflight["frame"],
+                "elapsed": time.monotonic() - inflight["queued"],
+            }
+
+        last = self.last
+        if last is not None:
+            status["last"] = {k: v for k, v in last.items() if k != "queued"}
+
+        return status
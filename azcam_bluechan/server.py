@@ -10,7 +10,6 @@ import azcam.shortcuts
 from azcam.cmdserver import CommandServer
 from azcam.header import System
 from azcam.tools.arc.controller_arc import ControllerArc
-from azcam.tools.arc.exposure_arc import ExposureArc
 from azcam.tools.arc.tempcon_arc import TempConArc
 from azcam.tools.ds9display import Ds9Display
 from azcam.tools.instrument import Instrument
@@ -20,6 +19,9 @@ from azcam.webtools.status.status import Status
 
 from azcam.monitor.monitorinterface import AzCamMonitorInterface
 from azcam_bluechan.ccdacq import CCDACQ
+from azcam_bluechan.exposure_bluechan import ExposureBlueChan
+from azcam_bluechan.icefrontend import IceFrontEnd
+from azcam_bluechan.receive_streaming import ReceiveDataStreaming
 
 
 def setup():
@@ -97,6 +99,10 @@ def setup():
     )
     NORMAL = 1
     cmdport = 2402
+    # serve clients from the asyncio ICE front-end, else azcam's CommandServer
+    ICEFRONTEND = 1
+    # start AzCamTool GUI
+    AZCAMTOOL = 1
 
     # ****************************************************************
     # controller
@@ -134,7 +140,8 @@ def setup():
     # ****************************************************************
     # exposure
     # ****************************************************************
-    exposure = ExposureArc()
+    exposure = ExposureBlueChan()
+    exposure.receive_data = ReceiveDataStreaming(exposure)
     remote_imageserver_port = 6543
     exposure.send_image = 1
     remote_imageserver_host = "pixel2"
@@ -142,6 +149,8 @@ def setup():
     exposure.sendimage.set_remote_imageserver(
         remote_imageserver_host, remote_imageserver_port, "ccdacq"
     )
+    exposure.sendimage.ccdacq_chunksize = 256 * 1024
+    exposure.sendimage.ccdacq_persistent = 1
     exposure.filetype = exposure.filetypes["FITS"]
     exposure.image.filetype = exposure.filetypes["FITS"]
     exposure.display_image = 0
@@ -199,6 +208,8 @@ def setup():
     # ****************************************************************
     ccdacq = CCDACQ()
     azcam.db.tools["ccdacq"] = ccdacq
+    # additional destinations receiving every frame, for example:
+    # ccdacq.adddestination("archive", "localhost", 6544)
 
     # ****************************************************************
     # read par file
@@ -212,10 +223,16 @@ def setup():
     cmdserver = CommandServer()
     cmdserver.port = cmdport
     cmdserver.case_insensitive = 1
-    azcam.log(f"Starting cmdserver - listening on port {cmdserver.port}")
-    # cmdserver.welcome_message = "Welcome - azcam-itl server"
-    cmdserver.start()
     azcam.db.default_tool = "ccdacq"
+    # cmdserver.welcome_message = "Welcome - azcam-itl server"
+    if ICEFRONTEND:
+        # asyncio front-end, status queries do not wait for exposure commands
+        frontend = IceFrontEnd(cmdport)
+        azcam.log(f"Starting icefrontend - listening on port {frontend.port}")
+        frontend.start()
+    else:
+        azcam.log(f"Starting cmdserver - listening on port {cmdserver.port}")
+        cmdserver.start()
 
     # ****************************************************************
     # web server
@@ -230,7 +247,7 @@ def setup():
     # ****************************************************************
     # GUIs
     # ****************************************************************
-    if 1:
+    if AZCAMTOOL:
         import azcam_bluechan.start_azcamtool
 
     # ****************************************************************
@@ -0,0 +1,163 @@
+"""
+Contains the SyntheticImage class which makes synthetic u2 frames.
+
+Frames are built with vectorized numpy operations directly as '<u2' arrays
+of shape (size_y, size_x), where the last overscan columns of each row
+contain only bias and read noise.
+"""
+
+import numpy
+
+
+class SyntheticImage(object):
+    """
+    Synthetic frame generator for demo mode and load testing.
+    Types are "ramp", "bias", "flat" and "cosmic".
+    """
+
+    def __init__(self, seed=None):
+        self.rng = numpy.random.default_rng(seed)
+
+        # bias level and read noise in ADU
+        self.bias = 1000.0
+        self.read_noise = 5.0
+        # mean flat field signal in ADU above bias
+        self.flat_level = 20000.0
+        # number of cosmic ray hits per frame
+        self.number_cosmics = 200
+
+        self.types = {
+            "ramp": self.ramp,
+            "bias": self.bias_frame,
+            "flat": self.flat_frame,
+            "cosmic": self.cosmic_frame,
+        }
+
+    def make(self, imagetype, size_x, size_y, overscan=0, out=None):
+        """
+        Return a frame of imagetype.
+        out may be a preallocated '<u2' array of size_x * size_y elements to fill.
+        """
+
+        try:
+            maker = self.types[imagetype]
+        except KeyError:
+            raise ValueError(f"unknown synthetic image type {imagetype}")
+
+        out = self._output(size_x, size_y, out)
+
+        return maker(size_x, size_y, overscan, out)
+
+    def make_focalplane(self, imagetype, focalplane, out=None):
+        """
+        Return a frame with the current size of an azcam focalplane.
+        """
+
+        return self.make(
+            imagetype,
+            focalplane.numcols_image,
+            focalplane.numrows_image,
+            focalplane.numcols_overscan,
+            out,
+        )
+
+    def frames(self, imagetype, number, size_x, size_y, overscan=0, pool=4):
+        """
+        Yield number frames, cycling through pool pregenerated frames so
+        frames are produced much faster than they are consumed.
+        """
+
+        frames = [
+            self.make(imagetype, size_x, size_y, overscan)
+            for _ in range(min(pool, number))
+        ]
+        for i in range(number):
+            yield frames[i % len(frames)]
+
+    # *************************************************************************
+    # frame types
+    # *************************************************************************
+
+    def ramp(self, size_x, size_y, overscan, out):
+        """
+        Pixel values count up along rows, wrapping at 65355.
+        """
+
+        numpy.remainder(
+            numpy.arange(size_x * size_y, dtype="<u4"),
+            65355,
+            out=out.reshape(-1),
+            casting="unsafe",
+        )
+
+        return out
+
+    def bias_frame(self, size_x, size_y, overscan, out):
+        """
+        Bias level plus gaussian read noise.
+        """
+
+        signal = self._noise(size_x, size_y)
+
+        return self._store(signal, out)
+
+    def flat_frame(self, size_x, size_y, overscan, out):
+        """
+        Uniform illumination with a gentle gradient along the dispersion
+        and shot noise, with bias only in the overscan.
+        """
+
+        signal = numpy.empty((size_y, size_x), dtype="<f4")
+        illum = self.flat_level * numpy.linspace(
+            0.8, 1.2, size_x - overscan, dtype="<f4"
+        )
+        signal[:, : size_x - overscan] = illum
+        signal[:, size_x - overscan :] = 0.0
+        signal += numpy.sqrt(signal) * self.rng.standard_normal(
+            signal.shape, dtype="<f4"
+        )
+        signal += self._noise(size_x, size_y)
+
+        return self._store(signal, out)
+
+    def cosmic_frame(self, size_x, size_y, overscan, out):
+        """
+        Bias frame with random cosmic ray hits of one to three pixels.
+        """
+
+        signal = self._noise(size_x, size_y)
+
+        number = self.number_cosmics
+        cols = self.rng.integers(0, max(size_x - overscan - 2, 1), number)
+        rows = self.rng.integers(0, size_y, number)
+        lengths = self.rng.integers(1, 4, number)
+        energies = self.rng.uniform(500.0, 30000.0, number).astype("<f4")
+        for i in range(3):
+            hit = lengths > i
+            signal[rows[hit], cols[hit] + i] += energies[hit]
+
+        return self._store(signal, out)
+
+    # *************************************************************************
+    # helpers
+    # *************************************************************************
+
+    def _output(self, size_x, size_y, out):
+        if out is None:
+            return numpy.empty((size_y, size_x), dtype="<u2")
+
+        return out.reshape(size_y, size_x)
+
+    def _noise(self, size_x, size_y):
+        noise = self.rng.standard_normal((size_y, size_x), dtype="<f4")
+        noise *= self.read_noise
+        noise += self.bias
+
+        return noise
+
+    def _store(self, signal, out):
+        numpy.rint(signal, out=signal)
+        numpy.clip(signal, 0, 65535, out=signal)
+        numpy.copyto(out, signal, casting="unsafe")
+
+        return out
@@ -0,0 +1,148 @@
+"""
+Contains the TemperatureSampler class which reads temperatures in the background.
+"""
+
+import threading
+import time
+
+import azcam
+import azcam.exceptions
+
+
+class TemperatureSampler(object):
+    """
+    Reads tempcon temperatures every period seconds in a background thread
+    and serves the last values, so temperature queries cost no controller I/O.
+    Sampling is held off while the exposure is reading out.
+    """
+
+    def __init__(self, period=5.0):
+        # seconds between samples
+        self.period = period
+
+        # last temperatures read and monotonic time they were read
+        self.temperatures = []
+        self.sampled = 0.0
+
+        self.samples = 0
+        self.skipped = 0
+        self.errors = 0
+
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+
+    def start(self):
+        """
+        Start the sampling thread if it is not running.
+        """
+
+        if self._thread is not None and self._thread.is_alive():
+            return
+
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._worker, name="temperature_sampler", daemon=True
+        )
+        self._thread.start()
+
+        return
+
+    def stop(self):
+        """
+        Stop the sampling thread.
+        """
+
+        self._stop.set()
+
+        return
+
+    def set_period(self, period):
+        """
+        Set seconds between samples, taking effect after the current wait.
+        """
+
+        period = float(period)
+        if period <= 0:
+            raise azcam.exceptions.AzcamError(f"invalid temperature period {period}")
+        self.period = period
+
+        return
+
+    def get_temperatures(self):
+        """
+        Return (temperatures, age in seconds) of the last sample.
+        The first call starts the sampling thread and samples immediately
+        unless the exposure is reading out, later calls never read the tempcon.
+        """
+
+        first = self._thread is None
+        self.start()
+
+        if first and not self._is_reading_out():
+            self._sample()
+
+        with self._lock:
+            if self.sampled == 0.0:
+                bad = azcam.db.tools["tempcon"].bad_temp_value
+                return [bad, bad], -1.0
+            return list(self.temperatures), time.monotonic() - self.sampled
+
+    def get_temperature(self, index):
+        """
+        Return the last sampled temperature index.
+        Raises AzcamError if the tempcon returned no such channel.
+        """
+
+        temperatures = self.get_temperatures()[0]
+        if not 0 <= index < len(temperatures):
+            raise azcam.exceptions.AzcamError(f"no temperature channel {index}")
+
+        return temperatures[index]
+
+    def get_stats(self):
+        """
+        Return last temperatures, their age and sample counts.
+        """
+
+        temperatures, age = self.get_temperatures()
+
+        return {
+            "temperatures": temperatures,
+            "age": age,
+            "period": self.period,
+            "samples": self.samples,
+            "skipped": self.skipped,
+            "errors": self.errors,
+        }
+
+    def _is_reading_out(self):
+        exposure = azcam.db.tools.get("exposure")
+        if exposure is None:
+            return False
+
+        return exposure.exposure_flag == exposure.exposureflags["READOUT"]
+
+    def _sample(self):
+        try:
+            temperatures = azcam.db.tools["tempcon"].get_temperatures()
+        except Exception as e:
+            self.errors += 1
+            azcam.log(f"could not read temperatures: {e}")
+            return
+
+        with self._lock:
+            self.temperatures = temperatures
+            self.sampled = time.monotonic()
+            self.samples += 1
+
+        return
+
+    def _worker(self):
+        while not self._stop.wait(self.period):
+            if self._is_reading_out():
+                self.skipped += 1
+                continue
+            self._sample()
+
+        return
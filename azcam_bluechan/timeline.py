@@ -0,0 +1,173 @@
+"""
+Contains the Timeline class which records the phases of each exposure.
+"""
+
+import contextlib
+import csv
+import time
+
+import numpy
+
+
+class Timeline(object):
+    """
+    Ring of exposure timelines stored in fixed numpy arrays.
+    Each exposure has a monotonic start and end time for each phase,
+    NaN for phases which did not happen.
+    """
+
+    phases = (
+        "begin",
+        "flush",
+        "integrate",
+        "readout",
+        "receive",
+        "headers",
+        "write",
+        "send",
+        "display",
+    )
+
+    def __init__(self, size=200):
+        self.size = size
+
+        # [exposure, phase, start/end] monotonic times
+        self.times = numpy.full((size, len(self.phases), 2), numpy.nan)
+        # wall clock and monotonic time each exposure started
+        self.wall = numpy.zeros(size)
+        self.origin = numpy.zeros(size)
+
+        # number of exposures recorded
+        self.count = 0
+
+        self._phase_index = {name: i for i, name in enumerate(self.phases)}
+
+    def start(self):
+        """
+        Start the timeline of a new exposure.
+        """
+
+        row = self.count % self.size
+        self.times[row] = numpy.nan
+        self.wall[row] = time.time()
+        self.origin[row] = time.monotonic()
+        self.count += 1
+
+        return
+
+    def start_phase(self, name):
+        """
+        Record the start of a phase of the current exposure.
+        """
+
+        self.mark(name, time.monotonic(), numpy.nan)
+
+        return
+
+    def end_phase(self, name):
+        """
+        Record the end of a phase of the current exposure.
+        Ignored if the phase was not started or has already ended.
+        """
+
+        if self.count == 0:
+            return
+
+        times = self.times[(self.count - 1) % self.size, self._phase_index[name]]
+        if not numpy.isnan(times[0]) and numpy.isnan(times[1]):
+            times[1] = time.monotonic()
+
+        return
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """
+        Context manager recording a phase of the current exposure.
+        """
+
+        self.start_phase(name)
+        try:
+            yield
+        finally:
+            self.end_phase(name)
+
+    def mark(self, name, start, end):
+        """
+        Record monotonic start and end times of a phase of the current exposure.
+        """
+
+        if self.count == 0:
+            return
+
+        self.times[(self.count - 1) % self.size, self._phase_index[name]] = (
+            start,
+            end,
+        )
+
+        return
+
+    def get_timing(self, number=10):
+        """
+        Return a list of the last number exposures, oldest first.
+        Phase times are [start, end] in seconds from the start of the exposure.
+        """
+
+        timing = []
+        for count in range(max(0, self.count - min(number, self.size)), self.count):
+            row = count % self.size
+            relative = self.times[row] - self.origin[row]
+            phases = {}
+            for i, name in enumerate(self.phases):
+                if not numpy.isnan(relative[i, 0]):
+                    start, end = relative[i].tolist()
+                    phases[name] = [start, None if numpy.isnan(end) else end]
+            timing.append(
+                {
+                    "exposure": count + 1,
+                    "time": float(self.wall[row]),
+                    "total": float(numpy.nanmax(relative)) if phases else 0.0,
+                    "phases": phases,
+                }
+            )
+
+        return timing
+
+    def get_summary(self):
+        """
+        Return mean duration in seconds of each phase over the stored exposures.
+        """
+
+        number = min(self.count, self.size)
+        if number == 0:
+            return {}
+
+        durations = self.times[:number, :, 1] - self.times[:number, :, 0]
+        summary = {}
+        for i, name in enumerate(self.phases):
+            valid = durations[:, i][~numpy.isnan(durations[:, i])]
+            if len(valid) > 0:
+                summary[name] = float(valid.mean())
+
+        return summary
+
+    def write_csv(self, filename):
+        """
+        Write all stored timelines to a CSV file, one exposure per row.
+        """
+
+        fields = ["exposure", "time"]
+        for name in self.phases:
+            fields.extend([f"{name}_start", f"{name}_end"])
+
+        with open(filename, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(fields)
+            for count in range(max(0, self.count - self.size), self.count):
+                row = count % self.size
+                relative = self.times[row] - self.origin[row]
+                values = [count + 1, f"{self.wall[row]:.3f}"]
+                for t in relative.ravel():
+                    values.append("" if numpy.isnan(t) else f"{t:.6f}")
+                writer.writerow(values)
+
+        return
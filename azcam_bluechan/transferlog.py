@@ -0,0 +1,81 @@
+"""
+Contains the TransferLog class which keeps phase timings of recent image sends.
+"""
+
+import collections
+import time
+
+
+class TransferLog(object):
+    """
+    Ring buffer of recent image transfers.
+    Each transfer is stored as a tuple, so adding one costs a single append.
+    Times are from time.monotonic() and are in seconds.
+    """
+
+    # tuple layout of each record
+    fields = ("destination", "start", "connect", "header", "payload", "ack", "bytes")
+
+    def __init__(self, size=100):
+        self.records = collections.deque(maxlen=size)
+
+        # total number of transfers recorded
+        self.count = 0
+
+    def add(self, destination, t0, t_connect, t_header, t_payload, t_ack, numbytes):
+        """
+        Record one transfer from the monotonic clock reading at the end of each phase.
+        """
+
+        self.records.append(
+            (
+                destination,
+                t0,
+                t_connect - t0,
+                t_header - t_connect,
+                t_payload - t_header,
+                t_ack - t_payload,
+                numbytes,
+            )
+        )
+        self.count += 1
+
+        return
+
+    def get_transfers(self, number=10):
+        """
+        Return the last number transfers as a list of dictionaries, newest last.
+        """
+
+        now = time.monotonic()
+        records = list(self.records)[-int(number) :]
+
+        transfers = []
+        for record in records:
+            transfer = dict(zip(self.fields, record))
+            transfer["age"] = now - transfer.pop("start")
+            total = sum(record[2:6])
+            transfer["total"] = total
+            transfer["rate"] = record[6] / record[4] if record[4] > 0 else 0.0
+            transfers.append(transfer)
+
+        return transfers
+
+    def get_summary(self):
+        """
+        Return mean phase times, mean payload rate and count for the buffered transfers.
+        """
+
+        records = list(self.records)
+        number = len(records)
+        summary = {"count": self.count, "buffered": number}
+        if number == 0:
+            return summary
+
+        for indx, name in enumerate(self.fields[2:6], 2):
+            summary[name] = sum(r[indx] for r in records) / number
+
+        payload = sum(r[4] for r in records)
+        summary["rate"] = sum(r[6] for r in records) / payload if payload > 0 else 0.0
+
+        return summary
@@ -0,0 +1,51 @@
+"""
+Tests of BufferPool.
+"""
+
+from azcam_bluechan.bufferpool import BufferPool
+
+
+def test_get_returns_current_buffer():
+    pool = BufferPool()
+
+    buff = pool.get((1, 100))
+
+    assert buff.shape == (1, 100)
+    assert buff.dtype == "<u2"
+    assert pool.get((1, 100)) is buff
+    assert pool.get_stats()["misses"] == 1
+    assert pool.get_stats()["hits"] == 1
+
+
+def test_next_rotates_buffers():
+    pool = BufferPool(depth=2)
+
+    first = pool.get((1, 100))
+    second = pool.next((1, 100))
+    third = pool.next((1, 100))
+
+    assert second is not first
+    assert third is first
+    assert pool.get((1, 100)) is third
+    assert pool.get_stats()["buffers"] == 2
+
+
+def test_least_recently_used_shape_is_evicted():
+    pool = BufferPool(max_bytes=900, depth=1)
+
+    pool.get((1, 200))
+    pool.get((1, 200))
+    pool.get((1, 300))
+
+    stats = pool.get_stats()
+    assert stats["shapes"] == [[1, 300]]
+    assert stats["evictions"] == 1
+
+
+def test_most_recent_shape_is_kept_over_cap():
+    pool = BufferPool(max_bytes=10)
+
+    buff = pool.get((1, 100))
+
+    assert pool.get((1, 100)) is buff
+    assert pool.get_bytes() == 200
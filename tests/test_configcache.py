@@ -0,0 +1,85 @@
+"""
+Tests of ConfigCache.
+"""
+
+from azcam_bluechan.configcache import ConfigCache
+
+
+class Recorder(object):
+    """
+    Setters which record each call and the resulting state.
+    """
+
+    def __init__(self):
+        self.calls = []
+        self.state = {}
+
+    def setter(self, name):
+        def set_config(*args):
+            self.calls.append((name, args))
+            self.state[name] = args
+
+        return set_config
+
+    def get_state(self, name):
+        return self.state.get(name)
+
+
+def test_repeated_request_is_skipped():
+    recorder = Recorder()
+    cache = ConfigCache(recorder.get_state)
+
+    assert cache.request("roi", recorder.setter("roi"), 1, 100)
+    assert cache.apply() == ["roi"]
+    assert not cache.request("roi", recorder.setter("roi"), 1, 100)
+    assert cache.apply() == []
+    assert recorder.calls == [("roi", (1, 100))]
+    assert cache.get_stats()["skipped"] == 1
+
+
+def test_apply_order_and_roi_after_format():
+    recorder = Recorder()
+    cache = ConfigCache(recorder.get_state)
+    cache.request("roi", recorder.setter("roi"), 1, 100)
+    cache.apply()
+    recorder.calls = []
+
+    cache.request("gain", recorder.setter("gain"), 2)
+    cache.request("format", recorder.setter("format"), 2688)
+
+    assert cache.apply() == ["format", "roi", "gain"]
+    assert [name for name, _ in recorder.calls] == ["format", "roi", "gain"]
+
+
+def test_external_change_is_applied_again():
+    recorder = Recorder()
+    cache = ConfigCache(recorder.get_state)
+    cache.request("roi", recorder.setter("roi"), 1, 100)
+    cache.apply()
+
+    recorder.state["roi"] = (1, 50)  # changed outside the cache
+
+    assert cache.request("roi", recorder.setter("roi"), 1, 100)
+    assert cache.apply() == ["roi"]
+    assert recorder.state["roi"] == (1, 100)
+
+
+def test_apply_geometry_only():
+    recorder = Recorder()
+    cache = ConfigCache(recorder.get_state)
+    cache.request("roi", recorder.setter("roi"), 1, 100)
+    cache.request("gain", recorder.setter("gain"), 2)
+
+    assert cache.apply(ConfigCache.geometry) == ["roi"]
+    assert cache.get_stats()["pending"] == ["gain"]
+
+
+def test_clear_applies_again():
+    recorder = Recorder()
+    cache = ConfigCache(recorder.get_state)
+    cache.request("gain", recorder.setter("gain"), 2)
+    cache.apply()
+
+    cache.clear()
+
+    assert cache.apply() == ["gain"]
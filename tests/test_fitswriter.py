@@ -0,0 +1,37 @@
+"""
+Tests of write_fits_u2.
+"""
+
+import numpy
+from astropy.io import fits
+
+from azcam_bluechan.fitswriter import write_fits_u2
+
+
+def test_write_fits_u2_round_trip(tmp_path):
+    data = numpy.array([[0, 1, 32767], [32768, 40000, 65535]], dtype="<u2")
+    header = fits.Header()
+    header["OBSERVER"] = ("someone", "observer name")
+    header["EXPTIME"] = (1.5, "exposure time")
+    header["NAXIS"] = 5  # structural keywords are not copied
+    filename = tmp_path / "frame.fits"
+
+    write_fits_u2(str(filename), data, header)
+
+    with fits.open(filename) as hdulist:
+        assert numpy.array_equal(hdulist[0].data, data)
+        assert hdulist[0].header["NAXIS"] == 2
+        assert hdulist[0].header["OBSERVER"] == "someone"
+        assert hdulist[0].header["EXPTIME"] == 1.5
+        assert hdulist[0].header.comments["EXPTIME"] == "exposure time"
+
+
+def test_write_fits_u2_block_sizes(tmp_path):
+    data = numpy.zeros((7, 11), dtype="<u2")
+    filename = tmp_path / "frame.fits"
+
+    write_fits_u2(str(filename), data)
+
+    assert filename.stat().st_size % 2880 == 0
+    with fits.open(filename) as hdulist:
+        assert hdulist[0].data.shape == (7, 11)
@@ -0,0 +1,64 @@
+"""
+Tests of FrameEvents.
+"""
+
+import threading
+import time
+
+import pytest
+
+import azcam.exceptions
+from azcam_bluechan.frameevents import FrameEvents
+
+
+def test_readout_starts_new_frame():
+    events = FrameEvents()
+
+    assert events.publish("readout") == 1
+    assert events.publish("valid", pixels=100) == 1
+    assert events.publish("readout") == 2
+    assert events.info["valid"] == {"pixels": 100, "frame": 1}
+
+
+def test_wait_returns_when_published():
+    events = FrameEvents()
+    events.publish("readout")
+
+    timer = threading.Timer(0.05, events.publish, ["valid"])
+    timer.start()
+    t0 = time.monotonic()
+
+    assert events.wait("valid", 2.0)
+    assert time.monotonic() - t0 < 1.0
+
+
+def test_wait_times_out_for_new_frame():
+    events = FrameEvents()
+    events.publish("readout")
+    events.publish("valid")
+    events.publish("readout")
+
+    assert not events.wait("valid", 0.05)
+    assert events.wait("valid", 0.05, frame=1)
+
+
+def test_subscribers_receive_selected_states():
+    events = FrameEvents()
+    received = []
+    subscriber = events.subscribe(
+        lambda state, frame, info: received.append((state, frame)), ["valid"]
+    )
+
+    events.publish("readout")
+    events.publish("valid")
+    events.unsubscribe(subscriber)
+    events.publish("valid")
+
+    assert received == [("valid", 1)]
+
+
+def test_unknown_state():
+    events = FrameEvents()
+
+    with pytest.raises(azcam.exceptions.AzcamError):
+        events.publish("finished")
@@ -0,0 +1,59 @@
+"""
+Tests of ParameterStore.
+"""
+
+import pytest
+
+import azcam
+import azcam.exceptions
+from azcam_bluechan.parameterstore import ParameterStore
+
+
+class Parameters(object):
+    """
+    Parameters with get_par and set_par as azcam.db.parameters.
+    """
+
+    def __init__(self, values, fail=()):
+        self.values = dict(values)
+        self.fail = set(fail)
+        self.writes = []
+
+    def get_par(self, parameter, subdict=None):
+        return self.values.get(parameter)
+
+    def set_par(self, parameter, value, subdict=None):
+        if parameter in self.fail:
+            raise ValueError(f"cannot set {parameter}")
+        self.writes.append(parameter)
+        self.values[parameter] = value
+
+
+@pytest.fixture
+def parameters(monkeypatch):
+    parameters = Parameters({"imagetest": 0, "imageautoname": 0})
+    monkeypatch.setattr(azcam.db, "parameters", parameters, raising=False)
+    return parameters
+
+
+def test_only_changed_parameters_are_written(parameters):
+    store = ParameterStore()
+
+    written = store.set_pars({"imagetest": "1", "imageautoname": 0})
+
+    assert written == ["imagetest"]
+    assert parameters.values["imagetest"] == 1
+    assert store.set_pars({"imagetest": 1, "imageautoname": 0}) == []
+    assert store.get_stats()["writes"] == 1
+    assert store.get_stats()["skipped"] == 3
+
+
+def test_failed_group_is_restored(parameters):
+    parameters.fail = {"imageautoname"}
+    store = ParameterStore()
+
+    with pytest.raises(azcam.exceptions.AzcamError):
+        store.set_pars({"imagetest": 1, "imageautoname": 1})
+
+    assert parameters.values["imagetest"] == 0
+    assert store.get_stats()["changed"] == []
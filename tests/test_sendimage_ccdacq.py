@@ -0,0 +1,106 @@
+"""
+Tests of the ccdacq send path against the local CcdacqImageServer.
+"""
+
+import socket
+import threading
+
+import numpy
+import pytest
+
+import azcam.exceptions
+from azcam_bluechan import sendimage_ccdacq
+from azcam_bluechan.ccdacq_imageserver import CcdacqImageServer
+
+SIZE_X = 64
+SIZE_Y = 32
+
+
+@pytest.fixture
+def server():
+    server = CcdacqImageServer("localhost", 0, (SIZE_X, SIZE_Y))
+    server.start()
+    yield server
+    server.stop()
+    sendimage_ccdacq.connections.close_all()
+
+
+def make_frame(offset=0):
+    return (numpy.arange(SIZE_X * SIZE_Y) + offset).astype("<u2")
+
+
+def test_send_frame(server):
+    buff = make_frame()
+
+    numsent, _ = sendimage_ccdacq.send_frame(
+        "localhost", server.port, SIZE_X, SIZE_Y, buff
+    )
+
+    assert numsent == buff.nbytes
+    assert server.get_stats()["frames"] == 1
+    assert server.get_stats()["invalid"] == 0
+    assert numpy.array_equal(server.last_image, buff.reshape(SIZE_Y, SIZE_X))
+
+
+def test_send_frame_reuses_connection(server):
+    for i in range(3):
+        sendimage_ccdacq.send_frame(
+            "localhost", server.port, SIZE_X, SIZE_Y, make_frame(i), chunksize=1000
+        )
+
+    stats = sendimage_ccdacq.connections.get("localhost", server.port).get_stats()
+    assert stats["connects"] == 1
+    assert stats["reuses"] == 2
+    assert stats["frames"] == 3
+    assert numpy.array_equal(server.last_image.ravel(), make_frame(2))
+
+
+def test_send_frame_not_persistent(server):
+    sendimage_ccdacq.send_frame(
+        "localhost", server.port, SIZE_X, SIZE_Y, make_frame(), persistent=0
+    )
+
+    stats = sendimage_ccdacq.connections.get("localhost", server.port).get_stats()
+    assert stats["connected"] == 0
+
+
+def fake_server(reply):
+    """
+    Start a server which reads one frame and sends reply, or nothing if None.
+    Returns (port, event to set to close the connection).
+    """
+
+    listener = socket.create_server(("localhost", 0))
+    done = threading.Event()
+
+    def run():
+        conn, _ = listener.accept()
+        rfile = conn.makefile("rb")
+        rfile.readline()
+        rfile.readline()
+        rfile.read(SIZE_X * SIZE_Y * 2)
+        if reply is not None:
+            conn.sendall(reply)
+        done.wait(5)
+        conn.close()
+        listener.close()
+
+    threading.Thread(target=run, daemon=True).start()
+
+    return listener.getsockname()[1], done
+
+
+@pytest.mark.parametrize("reply", [None, b"x"])
+def test_send_frame_bad_ack(monkeypatch, reply):
+    monkeypatch.setattr(sendimage_ccdacq, "ACK_TIMEOUT", 0.2)
+    port, done = fake_server(reply)
+
+    try:
+        with pytest.raises(azcam.exceptions.AzcamError):
+            sendimage_ccdacq.send_frame("localhost", port, SIZE_X, SIZE_Y, make_frame())
+    finally:
+        done.set()
+
+    connection = sendimage_ccdacq.connections.get("localhost", port)
+    assert connection.get_stats()["connected"] == 0
+    assert connection.get_stats()["failures"] == 1